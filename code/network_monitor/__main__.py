@@ -1,15 +1,57 @@
 #!/usr/bin/env python
+import argparse
 import os
 import sys
 import signal
-import time
+import threading
 
 from .scheduler import Scheduler
+from .aggregation import close_aggregator, get_aggregator
+from .client import close_client
+from .runner import shutdown_runner
+from .config import config_path, get_config, reload_config, watch_config
+from .inventory import get_inventory, inventory_path, reload_inventory
+from .sharding import get_shard
 from .checkers import PingChecker, HttpChecker, HttpsChecker
-from .checkers import SpeedtestChecker, IPerfChecker, IPerf3Checker
+from .checkers import SpeedtestChecker, IPerfChecker, IPerf3Checker, ThroughputChecker
+from .engines.throughput import ThroughputServer, DEFAULT_PORT
+
+def run_server(port: int) -> int:
+    """Run the throughput test server until interrupted"""
+    server = ThroughputServer(('', port))
+
+    def signal_handler(sig, frame):
+        print("\nShutting down gracefully...")
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    print(f"Throughput server listening on port {port}")
+    server.serve_forever()
+    return 0
 
 def main() -> int:
     """Application entry point"""
+    parser = argparse.ArgumentParser(prog='network-monitor', description='Network monitoring tool and reporter')
+    parser.add_argument('--server', action='store_true',
+                        help='run the throughput test server instead of the monitor')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('THROUGHPUT_SERVER_PORT', DEFAULT_PORT)),
+                        help='throughput server port (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.server:
+        return run_server(args.port)
+
+    try:
+        get_config()
+        get_inventory()
+        get_shard()
+        get_aggregator()
+    except (OSError, ValueError) as e:
+        print(f"Invalid configuration: {e}")
+        return 1
+
     scheduler = Scheduler()
 
     # Add checkers with optional initial delay
@@ -19,27 +61,43 @@ def main() -> int:
     scheduler.add_checker(SpeedtestChecker(), initial_delay=10)
     scheduler.add_checker(IPerfChecker(), initial_delay=10)
     scheduler.add_checker(IPerf3Checker(), initial_delay=10)
+    scheduler.add_checker(ThroughputChecker(), initial_delay=10)
 
     # Setup signal handlers for graceful shutdown
     def signal_handler(sig, frame):
         print("\nShutting down gracefully...")
         scheduler.stop()
+        shutdown_runner()
+        close_aggregator()
+        close_client()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    # Reload on SIGHUP or when CONFIG_FILE or INVENTORY_FILE change, applied by the main thread
+    reload_event = threading.Event()
+    signal.signal(signal.SIGHUP, lambda sig, frame: reload_event.set())
+    watch_config(reload_event.set, paths=[config_path(), inventory_path()])
+
     try:
         print("Starting monitoring scheduler...")
         scheduler.start()
 
         # Keep main thread alive
         while scheduler.is_running:
-            time.sleep(1)
+            if reload_event.wait(timeout=1):
+                reload_event.clear()
+                config, inventory = reload_config(), reload_inventory()
+                if config is not None or inventory is not None:
+                    scheduler.reload()
 
     except Exception as e:
         print(f"Fatal error: {e}")
         scheduler.stop()
+        shutdown_runner()
+        close_aggregator()
+        close_client()
         return 1
 
     return 0
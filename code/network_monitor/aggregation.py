@@ -0,0 +1,196 @@
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Optional
+
+from .client import get_client
+from .stats import percentile
+
+QUANTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+
+class _FieldWindow:
+    """
+    Samples of one field of one series in the current window.
+
+    count, min, max and the sum are exact. The quantiles come from a ring
+    buffer of the last capacity samples, exact as long as a window does not
+    hold more samples than that.
+    """
+
+    __slots__ = ('ring', 'capacity', 'position', 'count', 'total', 'min', 'max')
+
+    def __init__(self, capacity: int):
+        # Grows up to capacity, then the oldest samples are overwritten
+        self.ring = array('d')
+        self.capacity = capacity
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        if len(self.ring) < self.capacity:
+            self.ring.append(value)
+        else:
+            self.ring[self.position] = value
+            self.position = (self.position + 1) % self.capacity
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def summary(self, name: str) -> Dict[str, float]:
+        ordered = sorted(self.ring)
+        values = {
+            f'{name}_count': self.count,
+            # Floats for all fields, so the summary types never depend on the samples
+            f'{name}_min': float(self.min),
+            f'{name}_max': float(self.max),
+            f'{name}_mean': round(self.total / self.count, 4),
+        }
+        for suffix, fraction in QUANTILES:
+            values[f'{name}_{suffix}'] = round(percentile(ordered, fraction), 4)
+        return values
+
+class Aggregator:
+    """
+    Windowed aggregation of checker samples before they reach the client.
+
+    Numeric fields of every series (measurement and tags) are collected for
+    window seconds and replaced by one line per series carrying
+    <field>_count, _min, _max, _mean, _p50, _p95 and _p99, stamped with the
+    start of the window. Windows are aligned to the wall clock, so all
+    instances emit at the same times. Non-numeric fields are not
+    aggregated. With raw set the samples are written as well.
+    """
+
+    def __init__(self, window: float = 60, capacity: int = 256, raw: bool = False, enabled: bool = True):
+        if not window > 0:
+            raise ValueError(f"AGGREGATE_WINDOW must be greater than 0, got {window:g}")
+        if capacity < 1:
+            raise ValueError(f"AGGREGATE_SAMPLES must be at least 1, got {capacity}")
+        self.window = window
+        self.capacity = capacity
+        self.raw = raw
+        self.enabled = enabled
+
+        self.samples = 0
+        self.summaries = 0
+
+        # Series prefix -> field name -> window
+        self._series: Dict[str, Dict[str, _FieldWindow]] = {}
+        self._window_start = self._current_window()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the thread emitting the summaries, does nothing when already started"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._emit_loop, name='aggregator', daemon=True)
+        self._thread.start()
+        print(f"Aggregating samples over {self.window:g}s windows{', raw samples kept' if self.raw else ''}")
+
+    def stop(self) -> None:
+        """Stop the thread and emit the current, partial window"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.emit()
+
+    def add(self, prefix: str, values, timestamp: int = None) -> None:
+        """Add one sample of the series, raw samples are passed on to the client"""
+        if self.raw:
+            get_client().write(prefix, values, timestamp)
+        if not isinstance(values, dict):
+            values = {'value': values}
+
+        with self._lock:
+            fields = self._series.get(prefix)
+            if fields is None:
+                fields = self._series[prefix] = {}
+            for name, value in values.items():
+                kind = type(value)
+                if kind is not int and kind is not float or value != value:
+                    continue
+                field = fields.get(name)
+                if field is None:
+                    field = fields[name] = _FieldWindow(self.capacity)
+                field.add(value)
+            self.samples += 1
+
+    def emit(self) -> int:
+        """
+        Write the summaries of the current window and start a new one
+
+        Returns:
+            int: Number of summary lines written
+        """
+        with self._lock:
+            series, self._series = self._series, {}
+            # Never stamp two windows alike, the later point would overwrite the earlier one
+            window_start = self._window_start
+            self._window_start = max(self._current_window(), window_start + self.window)
+
+        client = get_client()
+        timestamp = int(window_start * 1e9)
+        written = 0
+        for prefix, fields in series.items():
+            values = {}
+            for name, field in fields.items():
+                values.update(field.summary(name))
+            if values:
+                client.write(prefix, values, timestamp)
+                written += 1
+        self.summaries += written
+        return written
+
+    def get_stats(self) -> dict:
+        return {
+            'samples': self.samples,
+            'summaries': self.summaries,
+            'series': len(self._series),
+        }
+
+    def _current_window(self) -> float:
+        return time.time() // self.window * self.window
+
+    def _emit_loop(self) -> None:
+        """Emit at every window boundary"""
+        while not self._stop_event.wait(max(0.0, self._window_start + self.window - time.time())):
+            self.emit()
+
+
+_aggregator: Optional[Aggregator] = None
+_aggregator_lock = threading.Lock()
+
+def get_aggregator() -> Aggregator:
+    """Get the process-wide aggregator, created on first use and disabled unless AGGREGATE_ENABLED is set"""
+    global _aggregator
+
+    aggregator = _aggregator
+    if aggregator is not None:
+        return aggregator
+
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = Aggregator(
+                window=float(os.environ.get('AGGREGATE_WINDOW', '60')),
+                capacity=int(os.environ.get('AGGREGATE_SAMPLES', '256')),
+                raw=os.environ.get('AGGREGATE_RAW', 'false').lower() in ('true', '1', 'yes', 'on'),
+                enabled=os.environ.get('AGGREGATE_ENABLED', 'false').lower() in ('true', '1', 'yes', 'on'),
+            )
+        return _aggregator
+
+def close_aggregator() -> None:
+    """Emit the partial window, before the client is closed"""
+    with _aggregator_lock:
+        if _aggregator is not None and _aggregator.enabled:
+            _aggregator.stop()
@@ -0,0 +1,13 @@
+"""
+Benchmark harness for Network Monitoring tool
+"""
+
+__version__ = "1.0.0"
+
+from .standins import TelegrafSink, HttpStandin, install_fake_tools
+
+__all__ = [
+    'TelegrafSink',
+    'HttpStandin',
+    'install_fake_tools',
+]
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+Benchmark of the real checkers and scheduler against local stand-ins
+
+    python -m network_monitor.bench --targets 10,100,1000,10000 --duration 30
+    python -m network_monitor.bench --targets 1000 --sinks tcp,udp,unix,influxdb
+    python -m network_monitor.bench --influxdb-scenarios
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from ..stats import percentile
+from .standins import TelegrafSink, TelegrafUdpSink, InfluxDBStandin, HttpStandin, install_fake_tools, make_certificate
+
+PROBE_TYPES = ('ping', 'http', 'https')
+
+def memory_rss() -> int:
+    """Current resident set size in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def ping_targets(count: int) -> List[str]:
+    """Distinct loopback addresses, 127.0.0.0/8 all answers locally on Linux"""
+    return [f'127.{(i >> 16) & 255}.{(i >> 8) & 255}.{(i & 255) + 1}' for i in range(count)]
+
+def configure(count: int, args, http: HttpStandin, https: HttpStandin) -> None:
+    """Point every checker at the stand-ins with count targets each"""
+    interval = f'{args.interval}s'
+    os.environ.update({
+        'PING_ENABLED': 'true',
+        'PING_TARGETS': ';'.join(ping_targets(count)),
+        'PING_INTERVAL': interval,
+        'PING_TIMEOUT': '1s',
+        'HTTP_ENABLED': 'true',
+        'HTTP_TARGETS': ';'.join(f'127.0.0.1:{http.address[1]}/{i}' for i in range(count)),
+        'HTTP_INTERVAL': interval,
+        'HTTP_KEEPALIVE': 'true' if args.keepalive else 'false',
+        'HTTP_CONCURRENCY': str(args.concurrency),
+        'HTTPS_ENABLED': 'true' if https else 'false',
+        'HTTPS_TARGETS': ';'.join(f'127.0.0.1:{https.address[1]}/{i}' for i in range(count)) if https else '',
+        'HTTPS_INTERVAL': interval,
+        'HTTPS_KEEPALIVE': 'true' if args.keepalive else 'false',
+        'HTTPS_CONCURRENCY': str(args.concurrency),
+        'HTTPS_VERIFY': 'false',
+        # Heavy checkers run once per scale against the fake executables
+        'IPERF3_ENABLED': 'true',
+        'IPERF3_TARGETS': '127.0.0.1',
+        'IPERF3_DURATION': '1s',
+        'IPERF3_INTERVAL': '1h',
+        'IPERF_ENABLED': 'true',
+        'IPERF_TARGETS': '127.0.0.1',
+        'IPERF_DURATION': '1s',
+        'IPERF_INTERVAL': '1h',
+        'SPEEDTEST_ENABLED': 'true',
+        'SPEEDTEST_INTERVAL': '1h',
+    })
+
+def start_sinks(names: List[str], workdir: str) -> Dict:
+    """Start a stand-in per sink and point the client settings at them"""
+    standins = {}
+    for name in names:
+        if name == 'tcp':
+            standin = standins[name] = TelegrafSink()
+            os.environ['INFLUXDB_HOST'], os.environ['INFLUXDB_PORT'] = standin.address[0], str(standin.address[1])
+        elif name == 'udp':
+            standin = standins[name] = TelegrafUdpSink()
+            os.environ['UDP_HOST'], os.environ['UDP_PORT'] = standin.address[0], str(standin.address[1])
+        elif name == 'unix':
+            standins[name] = TelegrafSink(path=os.path.join(workdir, 'telegraf.sock'))
+            os.environ['UNIX_SOCKET'] = os.path.join(workdir, 'telegraf.sock')
+        elif name == 'influxdb':
+            standin = standins[name] = InfluxDBStandin(token='bench')
+            os.environ.update({'INFLUXDB_V2_URL': standin.url, 'INFLUXDB_V2_TOKEN': 'bench',
+                               'INFLUXDB_V2_ORG': 'bench', 'INFLUXDB_V2_BUCKET': 'bench'})
+        else:
+            raise SystemExit(f"unknown sink '{name}'")
+    os.environ['SINKS'] = ';'.join(names)
+    return standins
+
+def run_scale(count: int, args, sinks: Dict, http: HttpStandin, https: HttpStandin) -> Dict:
+    """Run the scheduler with count targets per checker for args.duration seconds"""
+    from ..client import get_client
+    from ..config import reload_config
+    from ..scheduler import Scheduler
+    from ..checkers import PingChecker, HttpChecker, HttpsChecker
+    from ..checkers import SpeedtestChecker, IPerfChecker, IPerf3Checker
+
+    lags: List[float] = []
+    lags_lock = threading.Lock()
+
+    class BenchScheduler(Scheduler):
+        """Scheduler recording the start lag of every run"""
+
+        def _execute_tasks(self, tasks):
+            super()._execute_tasks(tasks)
+            with lags_lock:
+                lags.extend(task.start_lag for task in tasks)
+
+    # Time every write() of the shared client, metric() goes through it as well
+    client = get_client()
+    send_time = [0.0, 0]
+    send_lock = threading.Lock()
+    write = type(client).write.__get__(client)
+
+    def timed_write(*write_args, **write_kwargs):
+        start_time = time.perf_counter()
+        write(*write_args, **write_kwargs)
+        elapsed = time.perf_counter() - start_time
+        with send_lock:
+            send_time[0] += elapsed
+            send_time[1] += 1
+
+    configure(count, args, http, https)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reload_config()
+    client.write = timed_write
+    output = sys.stdout if args.verbose else io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(output):
+            checkers = [PingChecker(), HttpChecker(), HttpsChecker(),
+                        SpeedtestChecker(), IPerfChecker(), IPerf3Checker()]
+            scheduler = BenchScheduler(max_workers=args.workers, per_target=args.per_target)
+            for checker in checkers:
+                scheduler.add_checker(checker)
+
+            client.flush(wait=True)
+            time.sleep(0.2)
+            before = {name: standin.snapshot() for name, standin in sinks.items()}
+            sent_lines = client.sent_lines
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            rss = memory_rss()
+            start_time = time.perf_counter()
+
+            scheduler.start()
+            time.sleep(args.duration)
+            scheduler.stop()
+            # Let running checkers finish, so their metrics are counted
+            while any(task.running for task in scheduler.tasks) and time.perf_counter() - start_time < args.duration + 30:
+                time.sleep(0.05)
+
+            elapsed = time.perf_counter() - start_time
+            client.flush(wait=True)
+            for checker in checkers:
+                if hasattr(checker, 'probe'):
+                    checker.probe.shutdown()
+    finally:
+        del client.write
+
+    # Give the stand-ins a moment to drain their sockets
+    time.sleep(0.2)
+    after = {name: standin.snapshot() for name, standin in sinks.items()}
+    # Probes are counted on the first sink, every sink gets the same lines
+    first = next(iter(sinks))
+    before_types, after_types = before[first][2], after[first][2]
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    probes = {name: after_types[name] - before_types[name] for name in PROBE_TYPES}
+    total = sum(probes.values()) or 1
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    calls = send_time[1] or 1
+    # Interpolated like the exported percentiles, running checkers may still add lags
+    with lags_lock:
+        lags = sorted(lags)
+
+    return {
+        'targets': count,
+        'seconds': round(elapsed, 3),
+        'probes': probes,
+        'probes_per_second': round(sum(probes.values()) / elapsed, 1),
+        'runs': len(lags),
+        'lag_ms': {
+            'p50': round(percentile(lags, 0.50) * 1000, 3) if lags else 0.0,
+            'p95': round(percentile(lags, 0.95) * 1000, 3) if lags else 0.0,
+            'p99': round(percentile(lags, 0.99) * 1000, 3) if lags else 0.0,
+            'max': round(max(lags, default=0.0) * 1000, 3),
+        },
+        'cpu_ms_per_probe': round(cpu * 1000 / total, 4),
+        'rss_bytes_per_probe': round(max(0, memory_rss() - rss) / total, 1),
+        'rss_bytes': memory_rss(),
+        'peak_rss_bytes': end_usage.ru_maxrss * 1024,
+        'write_calls': send_time[1],
+        'write_us_per_call': round(send_time[0] * 1e6 / calls, 3),
+        'lines_sent': client.sent_lines - sent_lines,
+        'lines_received': {name: after[name][0] - before[name][0] for name in sinks},
+        'bytes_received': {name: after[name][1] - before[name][1] for name in sinks},
+    }
+
+# Name -> stand-in failures and status, sink retries, then the expected counters
+# of the sink, its spool and the lines the stand-in accepted after two batches
+INFLUXDB_SCENARIOS = {
+    # Retried until InfluxDB is back, nothing spooled
+    'retry': (2, 503, 3, {'sent': 6, 'dropped': 0, 'errors': 0, 'retries': 2,
+                          'spooled': 0, 'replayed': 0, 'received': 6}),
+    # Retries used up, the first batch is spooled and replayed after the second one went through
+    'spool': (2, 503, 1, {'sent': 6, 'dropped': 0, 'errors': 1, 'retries': 1,
+                          'spooled': 3, 'replayed': 3, 'received': 6}),
+    # Rejected batches are dropped at once, never retried or spooled
+    'reject': (1, 400, 3, {'sent': 3, 'dropped': 3, 'errors': 1, 'retries': 0,
+                           'spooled': 0, 'replayed': 0, 'received': 3}),
+}
+
+def run_influxdb_scenario(name: str, workdir: str) -> Dict:
+    """Deliver two batches of three lines through the InfluxDB sink against a failing stand-in"""
+    from ..sinks.influxdb import InfluxDBSink
+    from ..spool import MetricSpool
+
+    failures, status, retries, expected = INFLUXDB_SCENARIOS[name]
+    standin = InfluxDBStandin(token='bench', failures=failures, status=status, retry_after='0')
+    spool = MetricSpool(os.path.join(workdir, f'spool-{name}'))
+    sink = InfluxDBSink(url=standin.url, org='bench', bucket='bench', token='bench',
+                        retries=retries, backoff=0.01, workers=1, spool=spool)
+    try:
+        for batch in range(2):
+            payload = b''.join(f'bench,scenario={name} value={batch}i {line}\n'.encode()
+                               for line in range(3))
+            sink.submit(payload, 3)
+            # The spool is replayed right after a successful batch, on the same worker
+            sink.drain()
+        stats = sink.get_stats()
+        actual = {
+            'sent': stats['sent'],
+            'dropped': stats['dropped'],
+            'errors': stats['errors'],
+            'retries': stats['retries'],
+            'spooled': stats['spool']['spooled'],
+            'replayed': stats['spool']['replayed'],
+            'received': standin.snapshot()[0],
+        }
+        empty = spool.empty()
+    finally:
+        sink.close()
+        standin.close()
+
+    mismatches = {key: (actual[key], value) for key, value in expected.items() if actual[key] != value}
+    if not empty:
+        mismatches['spool_empty'] = (False, True)
+    return {'scenario': name, 'ok': not mismatches, 'counters': actual, 'mismatches': mismatches}
+
+def print_report(result: Dict) -> None:
+    lag = result['lag_ms']
+    probes = ' '.join(f'{name}={count}' for name, count in result['probes'].items())
+    print(f"targets={result['targets']:<6} {result['probes_per_second']:>9.1f} probes/s ({probes})")
+    print(f"  lag p50={lag['p50']:.3f}ms p95={lag['p95']:.3f}ms p99={lag['p99']:.3f}ms "
+          f"max={lag['max']:.3f}ms over {result['runs']} runs")
+    print(f"  cpu={result['cpu_ms_per_probe']:.4f}ms/probe rss={result['rss_bytes_per_probe']:.0f}B/probe "
+          f"(rss {result['rss_bytes'] // 1024}KiB, peak {result['peak_rss_bytes'] // 1024}KiB)")
+    print(f"  write()={result['write_us_per_call']:.3f}us/call over {result['write_calls']} calls, "
+          f"{result['lines_sent']} lines sent")
+    print('  received ' + ' '.join(f"{name}={lines} lines/{result['bytes_received'][name]}B"
+                                   for name, lines in result['lines_received'].items()))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='network-monitor-bench',
+                                     description='Benchmark checkers and scheduler against local stand-ins')
+    parser.add_argument('--targets', default='10,100,1000,10000',
+                        help='comma separated target counts per checker (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per scale (default: %(default)s)')
+    parser.add_argument('--interval', type=int, default=5, help='probe interval in seconds (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='HTTP stand-in response latency in seconds (default: %(default)s)')
+    parser.add_argument('--body-size', type=int, default=512, help='HTTP response body size (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=10, help='HTTP probe concurrency (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4, help='scheduler workers (default: %(default)s)')
+    parser.add_argument('--keepalive', action='store_true', help='reuse HTTP connections')
+    parser.add_argument('--whole', dest='per_target', action='store_false',
+                        help='run each checker as a whole instead of scheduling targets one by one')
+    parser.add_argument('--sinks', default='tcp',
+                        help='comma separated sinks to deliver to: tcp, udp, unix, influxdb (default: %(default)s)')
+    parser.add_argument('--influxdb-scenarios', action='store_true',
+                        help='check retries, spooling and rejections of the InfluxDB sink instead, '
+                             'exits with 1 if a counter is off')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='keep the output of checkers and scheduler')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='network-monitor-bench-')
+
+    if args.influxdb_scenarios:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+            results = [run_influxdb_scenario(name, workdir) for name in INFLUXDB_SCENARIOS]
+        if args.json:
+            print(json.dumps(results, indent=2))
+        for result in results:
+            if not args.json:
+                counters = ' '.join(f'{key}={value}' for key, value in result['counters'].items())
+                print(f"influxdb {result['scenario']:<7} {'ok' if result['ok'] else 'FAILED'} {counters}")
+            for key, (actual, expected) in result['mismatches'].items():
+                print(f"  {key}: got {actual}, expected {expected}", file=sys.stderr)
+        return 0 if all(result['ok'] for result in results) else 1
+
+    # The shared client connects to the sinks, so it has to exist before the first checker
+    sinks = start_sinks(args.sinks.split(','), workdir)
+    os.environ.pop('SPOOL_DIR', None)
+    os.environ['PATH'] = install_fake_tools(os.path.join(workdir, 'bin')) + os.pathsep + os.environ.get('PATH', '')
+
+    from ..client import get_client, close_client
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        get_client()
+
+    http = HttpStandin(latency=args.latency, body_size=args.body_size)
+    certificate = make_certificate(workdir)
+    if certificate is None:
+        print('openssl not found, skipping HTTPS', file=sys.stderr)
+    https = HttpStandin(latency=args.latency, body_size=args.body_size, certificate=certificate) if certificate else None
+
+    results = []
+    for count in (int(value) for value in args.targets.split(',')):
+        result = run_scale(count, args, sinks, http, https)
+        results.append(result)
+        if not args.json:
+            print_report(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        close_client()
+    http.close()
+    if https:
+        https.close()
+    for standin in sinks.values():
+        standin.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import gzip
+import os
+import shutil
+import socket
+import ssl
+import stat
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Recorded output of 'speedtest --format=json'
+SPEEDTEST_OUTPUT = {
+    'type': 'result',
+    'ping': {'jitter': 0.52, 'latency': 4.81, 'low': 4.12, 'high': 5.93},
+    'download': {'bandwidth': 11718750, 'bytes': 117000000, 'elapsed': 10000},
+    'upload': {'bandwidth': 5859375, 'bytes': 58000000, 'elapsed': 10000},
+    'packetLoss': 0,
+    'server': {'id': 1, 'host': 'speedtest.example.net', 'name': 'Example'},
+}
+
+# Recorded output of 'speedtest --servers --format=json', closest first
+SPEEDTEST_SERVERS = {
+    'type': 'serverList',
+    'servers': [
+        {'id': 1, 'host': 'speedtest.example.net', 'port': 8080, 'name': 'Example', 'location': 'Local'},
+        {'id': 2, 'host': 'speedtest2.example.net', 'port': 8080, 'name': 'Example', 'location': 'Remote'},
+    ],
+}
+
+# Recorded 'end' section of 'iperf3 -J', used for the streaming mode as well
+IPERF3_END = {
+    'sum_sent': {'bytes': 1175000000, 'bits_per_second': 940000000.0, 'retransmits': 3},
+    'sum_received': {'bytes': 1170000000, 'bits_per_second': 936000000.0},
+}
+
+IPERF3_INTERVAL = {
+    'streams': [{'bytes': 117500000, 'rtt': 850}],
+    'sum': {'seconds': 1.0, 'bytes': 117500000, 'bits_per_second': 940000000.0, 'retransmits': 0},
+}
+
+# Recorded 'iperf -y C' summary line
+IPERF_OUTPUT = '20240101000000,127.0.0.1,50000,127.0.0.1,5001,3,0.0-10.0,1175000000,940000000'
+
+FAKE_TOOL = '''#!{python}
+import json, sys, time
+args = sys.argv[1:]
+time.sleep({delay})
+{body}
+'''
+
+FAKE_BODIES = {
+    'speedtest': '''if '--servers' in args:
+    print(json.dumps({servers}))
+else:
+    result = {speedtest}
+    for arg in args:
+        if arg.startswith('--server-id='):
+            result['server']['id'] = int(arg.split('=', 1)[1])
+    print(json.dumps(result))''',
+    'iperf': 'print({iperf!r})',
+    'iperf3': '''if '--json-stream' in args:
+    for _ in range(int(args[args.index('--time') + 1])):
+        print(json.dumps({{'event': 'interval', 'data': {interval}}}), flush=True)
+    print(json.dumps({{'event': 'end', 'data': {end}}}))
+else:
+    print(json.dumps({{'end': {end}}}))''',
+}
+
+def install_fake_tools(directory: str, delay: float = 0.1) -> str:
+    """
+    Write fake speedtest, iperf and iperf3 executables that print recorded output
+
+    Returns:
+        str: The directory, to be prepended to PATH
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, body in FAKE_BODIES.items():
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(FAKE_TOOL.format(python=sys.executable, delay=delay, body=body.format(
+                speedtest=SPEEDTEST_OUTPUT, servers=SPEEDTEST_SERVERS, iperf=IPERF_OUTPUT, interval=IPERF3_INTERVAL, end=IPERF3_END)))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return directory
+
+def make_certificate(directory: str) -> Optional[Tuple[str, str]]:
+    """Create a self-signed certificate with the openssl CLI, None if it is not available"""
+    if shutil.which('openssl') is None:
+        return None
+
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    result = subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return (cert, key) if result.returncode == 0 else None
+
+class LineCounter:
+    """Received lines, bytes and lines per 'type' tag of a stand-in"""
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.types: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Tuple[int, int, Counter]:
+        with self._lock:
+            return self.lines, self.bytes, Counter(self.types)
+
+    def count(self, lines: List[bytes], size: int) -> None:
+        with self._lock:
+            self.bytes += size
+            self.lines += len(lines)
+            for line in lines:
+                start = line.find(b'type=')
+                if start >= 0:
+                    end = line.find(b' ', start)
+                    value = line[start + 5:end].split(b',')[0]
+                    self.types[value.decode('utf8', 'replace')] += 1
+
+class TelegrafSink(LineCounter):
+    """Fake Telegraf socket listener on TCP, or on a Unix socket when path is given"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, path: str = None):
+        super().__init__()
+        if path is not None:
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(path)
+            self._server.listen(64)
+        else:
+            self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    def _receive(self, conn: socket.socket) -> None:
+        pending = b''
+        with conn:
+            while True:
+                data = conn.recv(256 * 1024)
+                if not data:
+                    return
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                self.count(lines, len(data))
+
+    def close(self) -> None:
+        self._server.close()
+
+class TelegrafUdpSink(LineCounter):
+    """Fake Telegraf UDP listener, also checks that no line is split across datagrams"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__()
+        self.datagrams = 0
+        self.max_datagram = 0
+        self.broken = 0
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._server.bind((host, port))
+        self.address = self._server.getsockname()
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                data = self._server.recv(65535)
+            except OSError:
+                return
+            self.datagrams += 1
+            self.max_datagram = max(self.max_datagram, len(data))
+            if not data.endswith(b'\n'):
+                self.broken += 1
+            self.count(data.rstrip(b'\n').split(b'\n'), len(data))
+
+    def close(self) -> None:
+        self._server.close()
+
+class InfluxDBStandin(LineCounter):
+    """
+    Fake InfluxDB v2 write endpoint accepting gzip or plain bodies.
+
+    The first failures requests are answered with status (and Retry-After
+    if given) instead of 204, to exercise retries. Requests without the
+    expected token are answered with 401.
+    """
+
+    def __init__(self, token: str = '', failures: int = 0, status: int = 503, retry_after: str = None):
+        super().__init__()
+        self.requests = 0
+        self.connections = set()
+        self.failures = failures
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with standin._lock:
+                    standin.requests += 1
+                    standin.connections.add(self.client_address)
+                    failing = standin.failures > 0
+                    if failing:
+                        standin.failures -= 1
+
+                query = parse_qs(urlsplit(self.path).query)
+                if urlsplit(self.path).path != '/api/v2/write' or query.get('precision') != ['ns']:
+                    return self.reply(404)
+                if token and self.headers.get('Authorization') != f'Token {token}':
+                    return self.reply(401)
+                if failing:
+                    return self.reply(status, retry_after)
+
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                standin.count(body.rstrip(b'\n').split(b'\n'), len(body))
+                self.reply(204)
+
+            def reply(self, code: int, retry_after: str = None):
+                self.send_response(code)
+                if retry_after is not None:
+                    self.send_header('Retry-After', retry_after)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                pass
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self.address = self._server.server_address
+        self.url = f'http://{self.address[0]}:{self.address[1]}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+class HttpStandin:
+    """Local HTTP or HTTPS server answering every GET after a configurable latency"""
+
+    def __init__(self, latency: float = 0.0, body_size: int = 512, certificate: Tuple[str, str] = None):
+        body = b'x' * body_size
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        context = None
+        if certificate is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*certificate)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024
+
+            def finish_request(self, request, client_address):
+                # TLS handshake on the connection thread, not on the accept loop
+                if context is not None:
+                    request = context.wrap_socket(request, server_side=True)
+                super().finish_request(request, client_address)
+
+            def handle_error(self, request, client_address):
+                pass
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -11,6 +11,7 @@ from .https import HttpsChecker
 from .speedtest import SpeedtestChecker
 from .iperf import IPerfChecker
 from .iperf3 import IPerf3Checker
+from .throughput import ThroughputChecker
 
 __all__ = [
     'BaseChecker',
@@ -20,4 +21,5 @@ __all__ = [
     'SpeedtestChecker',
     'IPerfChecker',
     'IPerf3Checker',
-]
\ No newline at end of file
+    'ThroughputChecker',
+]
@@ -1,21 +1,59 @@
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 
-from ..client import TelegrafClient
+from ..aggregation import get_aggregator
+from ..client import get_client
+from ..config import get_config
+from ..health import TargetHealth
+from ..inventory import InventoryTarget, get_inventory, merge_targets
+from ..lineprotocol import Tags
+from ..sharding import get_shard
+
+# Resource classes used by the scheduler: light checkers run in parallel,
+# every other class allows only one running checker at a time
+RESOURCE_LIGHT = 'light'
+RESOURCE_EXCLUSIVE_BANDWIDTH = 'exclusive-bandwidth'
 
 class BaseChecker(ABC):
     """Abstract base class for all checkers"""
 
+    resource_class = RESOURCE_LIGHT
+
+    # Attribute of Config holding the settings of the checker
+    config_section: str = None
+
+    # Samples go through the windowed aggregation when AGGREGATE_ENABLED is set
+    aggregated = False
+
     def __init__(self, name: str = None):
         self.name = name or self.__class__.__name__
         self.bucket = os.environ.get('INFLUXDB_METRIC', 'network-monitor')
 
-        # Create Telegraf client
-        host = str(os.environ.get('INFLUXDB_HOST', 'localhost'))
-        port = int(os.environ.get('INFLUXDB_PORT', '8086'))
-        self.client = TelegrafClient(host, port)
-        print(f'Created client: {self.name}, {host}:{port} -> {self.bucket}'),
+        # Set by the scheduler when light checkers ran during an exclusive run
+        self.light_overlap = False
+
+        # Targets merged from config and inventory, rebuilt when either is reloaded
+        self._targets_source = None
+        self._targets: list = []
+
+        # Targets probed on the current thread, see probed_targets()
+        self._local = threading.local()
+
+        # Circuit breaker and cadence of every target, used when HEALTH_ENABLED is set
+        self.health = TargetHealth()
+
+        # All checkers share one Telegraf connection
+        self.client = get_client()
+        self.series = self.client.series(self.bucket)
+        self._series_inventory = None
+        print(f'Created checker: {self.name} -> {self.bucket}')
+
+    @property
+    def config(self):
+        """Current settings of the checker, a new object after every reload"""
+        return getattr(get_config(), self.config_section)
 
     @abstractmethod
     def enabled(self) -> bool:
@@ -27,27 +65,138 @@ class BaseChecker(ABC):
         """Execute check and return interval until next run"""
         pass
 
-    def get_timeout(self, env_var: str, default: str) -> int:
-        """Get timeout from environment variable"""
-        return self.get_seconds_from_string(os.environ.get(env_var, default))
-
-    def get_targets(self, env_var: str) -> list:
-        """Get targets list from environment variable"""
-        return list(filter(None, [h.strip() for h in os.environ.get(env_var, '').split(';')]))
-
-    def get_seconds_from_string(self, value: str) -> int:
-        """Convert time to seconds"""
-        if value.endswith('s'):
-            return int(value[:-1])
-        elif value.endswith('m'):
-            return int(value[:-1]) * 60
-        elif value.endswith('h'):
-            return int(value[:-1]) * 3600
-        else:
-            return int(value)
-
-    def get_boolean_from_string(self, value: str) -> bool:
-        """Convert string to boolean"""
-        if isinstance(value, bool):
-            return value
-        return value.lower() in ('true', '1', 't', 'y', 'yes', 'on', 'enable', 'enabled')
\ No newline at end of file
+    def get_interval(self) -> int:
+        """Configured interval between runs in seconds"""
+        return 60
+
+    def list_targets(self) -> list:
+        """Targets that can be scheduled one by one, empty if the checker only runs as a whole"""
+        return []
+
+    def per_target_reason(self) -> str:
+        """Why the checker needs per-target scheduling, empty if whole-checker runs do"""
+        if not self.list_targets():
+            return ''
+        if get_config().health.enabled:
+            return 'HEALTH_ENABLED is set'
+        if any(item.interval is not None for item in get_inventory().targets(self.config_section).values()):
+            return 'inventory targets have their own interval'
+        return ''
+
+    def check_targets(self, targets: list) -> int:
+        """Execute check for the given subset of targets and return interval until next run, a whole run by default"""
+        return self.check()
+
+    def count_probed(self, targets: int = 1) -> None:
+        """Account targets actually probed by the running check"""
+        self._local.probed = getattr(self._local, 'probed', 0) + targets
+
+    def probed_targets(self) -> int:
+        """Number of targets probed on the current thread, the scheduler takes the difference around a run"""
+        return getattr(self._local, 'probed', 0)
+
+    def configured_targets(self) -> list:
+        """Targets of the config followed by those of the inventory, without duplicates, owned by this shard"""
+        config, inventory = self.config, get_inventory()
+        source = self._targets_source
+        if source is None or source[0] is not config or source[1] is not inventory:
+            self._targets = get_shard().select(merge_targets(config.targets, inventory.targets(self.config_section)))
+            self._targets_source = (config, inventory)
+            self.health.retain(self._targets)
+        return self._targets
+
+    def due_targets(self, targets: list) -> list:
+        """Targets to probe in a whole-checker run, open circuits are skipped until their backoff elapsed"""
+        if not get_config().health.enabled:
+            return targets
+        interval = self.get_interval()
+        return [target for target in targets if self.health.due(target, interval)]
+
+    def get_target(self, target: str) -> Optional[InventoryTarget]:
+        """Inventory settings of the target, None if it only comes from the config"""
+        return get_inventory().get(self.config_section, target)
+
+    def configured_interval(self, target: str) -> int:
+        """Regular interval of a single target, the inventory overrides the checker interval"""
+        item = self.get_target(target)
+        return item.interval if item is not None and item.interval is not None else self.get_interval()
+
+    def get_target_interval(self, target: str) -> int:
+        """Interval until the next probe of a target, adapted to its health with HEALTH_ENABLED"""
+        interval = self.configured_interval(target)
+        health = get_config().health
+        return self.health.interval(target, interval, health) if health.enabled else interval
+
+    def get_target_timeout(self, target: str) -> int:
+        """Timeout of a single target from the inventory or config, shorter for trials of open circuits"""
+        item = self.get_target(target)
+        timeout = item.timeout if item is not None and item.timeout is not None else self.config.timeout
+        health = get_config().health
+        if health.enabled and self.health.is_open(target):
+            return min(timeout, health.trial_timeout)
+        return timeout
+
+    def record_result(self, target: str, up: bool, timestamp: int = None) -> None:
+        """Feed a probe result to the health of the target, emits its state after a change"""
+        health = get_config().health
+        if not health.enabled:
+            return
+
+        interval = self.configured_interval(target)
+        state = self.health.record(target, up, interval, health)
+        if state is None:
+            return
+
+        self.send_point(
+            (target, 'health'),
+            lambda: {
+                **self.target_tags(target),
+                'type': 'health',
+                'checker': self.config_section,
+                'target': target,
+            },
+            {
+                'state': state.state,
+                'up': up,
+                'failures': state.failures,
+                'interval': self.health.interval(target, interval, health),
+            },
+            timestamp,
+            raw=True,
+        )
+
+    def target_tags(self, target: str) -> Dict[str, str]:
+        """Extra tags of the target from the inventory"""
+        item = self.get_target(target)
+        return item.tags if item is not None and item.tags else {}
+
+    def send_point(self, key: Hashable, tags: Tags, values: Dict[str, Any], timestamp: int = None,
+                   raw: bool = False) -> None:
+        """
+        Send one sample of the checker's measurement
+
+        Args:
+            key: Cheap hashable key that determines the tags, e.g. (target, result)
+            tags: Tags or a callable returning them, only used the first time key is seen
+            values: Field values
+            timestamp: Nanoseconds since the epoch, taken when the probe ran
+            raw: Write the sample as is, also when the checker is aggregated
+        """
+        inventory = get_inventory()
+        if inventory is not self._series_inventory:
+            # Inventory tags may have changed with a reload
+            self.series.clear()
+            self._series_inventory = inventory
+        prefix = self.series.prefix(key, tags)
+        if self.aggregated and not raw:
+            aggregator = get_aggregator()
+            if aggregator.enabled:
+                aggregator.add(prefix, values, timestamp)
+                return
+        self.client.write(prefix, values, timestamp)
+
+    def resource_tags(self) -> Dict[str, str]:
+        """Tags describing resource contention during the current run"""
+        if self.resource_class == RESOURCE_LIGHT:
+            return {}
+        return {'light_overlap': 'true' if self.light_overlap else 'false'}
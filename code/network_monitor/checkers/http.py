@@ -1,51 +1,92 @@
-import os
-import time
-import requests
+import threading
 
 from .base import BaseChecker
+from ..engines import HttpProbe
 
 class HttpChecker(BaseChecker):
     """Checker for HTTP-request monitoring"""
 
+    scheme = 'http'
+    config_section = 'http'
+    aggregated = True
+
+    def __init__(self, name: str = None):
+        super().__init__(name)
+        self._probe_lock = threading.Lock()
+        self._probe_options = None
+        self.probe = self.get_probe()
+
+    def get_probe(self) -> HttpProbe:
+        """Probe engine for the current settings, rebuilt when a reload changed them"""
+        config = self.config
+        options = (config.concurrency, config.keepalive, config.verify, config.max_bytes, config.chunk_size)
+
+        with self._probe_lock:
+            if options != self._probe_options:
+                if self._probe_options is not None:
+                    self.probe.shutdown()
+                self.probe = HttpProbe(
+                    concurrency=config.concurrency,
+                    keepalive=config.keepalive,
+                    verify=config.verify,
+                    max_bytes=config.max_bytes,
+                    chunk_size=config.chunk_size,
+                )
+                self._probe_options = options
+            return self.probe
+
     def enabled(self) -> bool:
-        return self.get_boolean_from_string(os.environ.get('HTTP_ENABLED', 'false'))
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
+
+    def list_targets(self) -> list:
+        return self.configured_targets()
 
     def check(self) -> int:
-        max_timeout_secs = self.get_timeout('HTTP_TIMEOUT', '5s')
-        expected_status = list(map(int, filter(None,
-            [url.strip() for url in os.environ.get('HTTP_EXPECTED_STATUS', '200;301;').split(';')])))
-        targets = self.get_targets('HTTP_TARGETS')
-
-        for target in targets:
-            status_code = None
-            start_time = time.time()
-
-            url = "http://" + target
-            try:
-                response = requests.get(url, timeout=max_timeout_secs, verify=True)
-                duration_ms = (time.time() - start_time) * 1000
-                status_code = response.status_code
-
-                if status_code in expected_status:
-                    print('{:30} ** success ({}) {:.1f} ms'.format('GET ' + url, status_code, duration_ms))
-                else:
-                    print('{:30} ** failed ({}) {:.1f} ms'.format('GET ' + url, status_code, duration_ms))
-
-            except Exception as e:
-                duration_ms = (time.time() - start_time) * 1000
-                print('{:30} ** {}'.format('GET ' + url, e))
-
-            self.client.metric(
-                self.bucket,
-                tags={
-                    'type': 'http',
+        return self.check_targets(self.due_targets(self.list_targets()))
+
+    def check_targets(self, targets: list) -> int:
+        config = self.config
+        interval_secs = config.interval
+        deadline_secs = config.deadline if config.deadline is not None else interval_secs
+
+        self.count_probed(len(targets))
+        urls = [f'{self.scheme}://{target}' for target in targets]
+        items = [self.get_target(target) for target in targets]
+        timeouts = [self.get_target_timeout(target) for target in targets]
+        results = self.get_probe().probe(urls, config.timeout, deadline_secs, timeouts)
+
+        for target, item, result in zip(targets, items, results):
+            expected_status = item.expected_status if item is not None and item.expected_status else config.expected_status
+            success = result.status_code in expected_status
+            values = {
+                'duration': int(result.duration_ms),
+                **result.phases(),
+            }
+            if config.throughput and result.throughput is not None:
+                values['bytes'] = result.bytes_read
+                values['throughput'] = round(result.throughput, 1)
+
+            if result.error is not None:
+                print('{:30} ** {}'.format('GET ' + result.url, result.error))
+            else:
+                print('{:30} ** {} ({}) {:.1f} ms'.format('GET ' + result.url,
+                    'success' if success else 'failed', result.status_code, result.duration_ms))
+
+            self.send_point(
+                (target, success),
+                lambda: {
+                    **self.target_tags(target),
+                    'type': self.scheme,
                     'method': 'GET',
-                    'target': url,
-                    'result': 'success' if (status_code in expected_status) else 'failed',
+                    'target': result.url,
+                    'result': 'success' if success else 'failed',
                 },
-                values={
-                    'duration': int(duration_ms),
-                }
+                values,
+                result.timestamp,
             )
+            self.record_result(target, success, result.timestamp)
 
-        return self.get_timeout('HTTP_INTERVAL', '60s')
+        return interval_secs
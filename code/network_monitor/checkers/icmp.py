@@ -1,60 +1,103 @@
-import os
-import ping3
+import math
+import socket
+import time
 from .base import BaseChecker
+from ..engines import BurstStats, Pinger
+from ..resolver import get_resolver
 
 class PingChecker(BaseChecker):
     """Checker for ping monitoring"""
 
+    config_section = 'ping'
+    aggregated = True
+
+    def __init__(self, name: str = None):
+        super().__init__(name)
+        self.pinger = Pinger()
+
     def enabled(self) -> bool:
-        return self.get_boolean_from_string(os.environ.get('PING_ENABLED', 'false'))
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
+
+    def list_targets(self) -> list:
+        return self.configured_targets()
 
     def check(self) -> int:
-        max_timeout_secs = self.get_timeout('PING_TIMEOUT', '5s')
-        hosts = self.get_targets('PING_TARGETS')
+        return self.check_targets(self.due_targets(self.list_targets()))
+
+    def check_targets(self, hosts: list) -> int:
+        config = self.config
 
+        # Samples are stamped with the time the probes were sent
+        timestamp = time.time_ns()
+        self.count_probed(len(hosts))
+        resolved = []
+        addresses = get_resolver().resolve_many(hosts, socket.AF_INET)
         for host in hosts:
-            try:
-                duration_ms = ping3.ping(host, unit='ms', timeout=max_timeout_secs)
+            if isinstance(addresses[host], Exception):
+                print('{:30} ** {}'.format('ping ' + host, addresses[host]))
+                self.send_metrics(host, 'failed', -1, timestamp)
+                self.record_result(host, False, timestamp)
+            else:
+                resolved.append((host, addresses[host][0][1]))
 
-                if duration_ms is not None:
+        # Multiplexed rounds with the longest timeout, replies over a target's own timeout count as lost
+        count = max(1, config.count)
+        timeouts = [self.get_target_timeout(host) for host, _ in resolved]
+        try:
+            rtts = self.pinger.burst([address for _, address in resolved], count, config.spacing,
+                                     max(timeouts, default=config.timeout))
+        except Exception as e:
+            print('{:30} ** {}'.format('ping', e))
+            for host, _ in resolved:
+                self.send_metrics(host, 'failed', -1, timestamp)
+            return config.interval
+
+        for index, ((host, _), timeout) in enumerate(zip(resolved, timeouts)):
+            samples = rtts[index * count:(index + 1) * count]
+            for sample, rtt in enumerate(samples):
+                if rtt > timeout * 1000:
+                    samples[sample] = math.nan
+
+            if count == 1:
+                rtt = samples[0]
+                if rtt == rtt:
                     print('{:30} ** success'.format('ping ' + host))
-                    self.client.metric(
-                        self.bucket,
-                        tags={
-                            'type': 'ping',
-                            'target': host,
-                            'result': 'success',
-                        },
-                        values={
-                            'duration': int(duration_ms),
-                        },
-                    )
+                    self.send_metrics(host, 'success', int(rtt), timestamp, {'rtt': round(rtt, 4)})
                 else:
                     print('{:30} ** timeout'.format('ping ' + host))
-                    self.client.metric(
-                        self.bucket,
-                        tags={
-                            'type': 'ping',
-                            'target': host,
-                            'result': 'timeout',
-                        },
-                        values={
-                            'duration': int(-1),
-                        },
-                    )
-
-            except Exception as e:
-                print('{:30} ** {}'.format('ping ' + host, e))
-                self.client.metric(
-                    self.bucket,
-                    tags={
-                        'type': 'ping',
-                        'target': host,
-                        'result': 'failed',
-                    },
-                    values={
-                        'duration': int(-1),
-                    },
-                )
-
-        return self.get_timeout('PING_INTERVAL', '60s')
+                    self.send_metrics(host, 'timeout', -1, timestamp)
+                self.record_result(host, rtt == rtt, timestamp)
+                continue
+
+            # The whole burst is one point
+            stats = BurstStats.from_samples(samples)
+            if stats.received:
+                print('{:30} ** success {}/{} avg {:.3f} ms jitter {:.3f} ms'.format(
+                    'ping ' + host, stats.received, stats.sent, stats.avg, stats.jitter))
+                self.send_metrics(host, 'success', int(stats.avg), timestamp, stats.fields())
+            else:
+                print('{:30} ** timeout'.format('ping ' + host))
+                self.send_metrics(host, 'timeout', -1, timestamp, stats.fields())
+            self.record_result(host, stats.received > 0, timestamp)
+
+        return config.interval
+
+    def send_metrics(self, host: str, result: str, duration_ms: int, timestamp: int = None, stats: dict = None) -> None:
+        """Send ping metrics to InfluxDB, duration stays an integer for existing series, stats are floats"""
+        self.send_point(
+            (host, result),
+            lambda: {
+                **self.target_tags(host),
+                'type': 'ping',
+                'target': host,
+                'result': result,
+            },
+            {
+                'duration': duration_ms,
+                **(stats or {}),
+            },
+            timestamp,
+        )
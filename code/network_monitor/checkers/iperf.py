@@ -1,26 +1,34 @@
-import os
 import time
 import csv
-import subprocess
 from io import StringIO
 
-from .base import BaseChecker
+from .base import BaseChecker, RESOURCE_EXCLUSIVE_BANDWIDTH
+from ..resolver import get_resolver
+from ..runner import get_runner
 
 class IPerfChecker(BaseChecker):
     """iperf network performance test"""
 
+    resource_class = RESOURCE_EXCLUSIVE_BANDWIDTH
+    config_section = 'iperf'
+
     def enabled(self) -> bool:
-        return self.get_boolean_from_string(os.environ.get('IPERF_ENABLED', 'false'))
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
 
     def check(self) -> int:
-        interval_secs = self.get_timeout('IPERF_INTERVAL', '1h')
-        max_timeout_secs = self.get_timeout('IPERF_TIMEOUT', '30s')
-        duration_secs = self.get_timeout('IPERF_DURATION', '10s')
-        jobs = os.environ.get('IPERF_JOBS', '1')
+        config = self.config
+        interval_secs = config.interval
+        duration_secs = config.duration
+        jobs = str(config.jobs)
 
-        targets = self.get_targets('IPERF_TARGETS')
+        targets = self.configured_targets()
 
         for server in targets:
+            self.count_probed()
+            max_timeout_secs = self.get_target_timeout(server)
             start_time = time.time()
             data, success = self.run_test('upload', server, max_timeout_secs, duration_secs, jobs)
             if success:
@@ -42,39 +50,33 @@ class IPerfChecker(BaseChecker):
         """Run iperf test with specified direction and return data and success status"""
         try:
             print(f"Running {direction} test to server {server} using {jobs} connection(s)...")
+            address = get_resolver().resolve(server)[0][1]
 
-            cmd = f"iperf -c {server} -t {duration_secs} -P {jobs} -y C"
+            cmd = ['iperf', '-c', address, '-t', str(duration_secs), '-P', jobs, '-y', 'C']
             if direction == 'download':
-                cmd += " -R"
-
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                check=True,
-                timeout=max_timeout_secs
-            )
+                cmd.append('-R')
 
-            csv_output = result.stdout.decode('utf-8').strip()
-            data = self.parse_csv_output(csv_output)
-            return data, True
+            result = get_runner().run(cmd, timeout=max_timeout_secs)
 
-        except subprocess.TimeoutExpired:
-            print(f"** iperf {direction} timeout after {max_timeout_secs} seconds")
-            return None, False
+            if result.timed_out:
+                print(f"** iperf {direction} timeout after {max_timeout_secs} seconds")
+                return None, False
 
-        except subprocess.CalledProcessError as e:
-            stdout = e.stdout.decode().rstrip() if e.stdout else ""
-            stderr = e.stderr.decode().rstrip() if e.stderr else ""
+            if result.returncode != 0:
+                stdout = result.stdout.decode().rstrip()
+                stderr = result.stderr.decode().rstrip()
 
-            print(f"** iperf {direction} failed (rc: {e.returncode})")
-            if stdout:
-                print(f"STDOUT: {stdout}")
-            if stderr:
-                print(f"STDERR: {stderr}")
+                print(f"** iperf {direction} failed (rc: {result.returncode})")
+                if stdout:
+                    print(f"STDOUT: {stdout}")
+                if stderr:
+                    print(f"STDERR: {stderr}")
 
-            return None, False
+                return None, False
+
+            csv_output = result.stdout.decode('utf-8').strip()
+            data = self.parse_csv_output(csv_output)
+            return data, True
 
         except Exception as e:
             print(f"** iperf {direction} unexpected error: {e}")
@@ -117,20 +119,23 @@ class IPerfChecker(BaseChecker):
             print(f"UPLOAD ** {bandwidth_mbps:.2f} Mbps, threads: {thread_count}, duration: {duration_ms:.0f} ms")
 
             # Send upload metrics
-            self.client.metric(
-                self.bucket,
-                tags={
+            self.send_point(
+                ('upload', server, self.light_overlap),
+                lambda: {
+                    **self.target_tags(server),
                     'type': 'iperf',
                     'direction': 'upload',
                     'result': 'success',
                     'server': server,
+                    **self.resource_tags(),
                 },
-                values={
+                {
                     'bandwidth': round(bandwidth_mbps, 2),
                     'threads': thread_count,
                     'bytes': summary['bytes'],
                     'duration': int(duration_ms),
-                }
+                },
+                int(start_time * 1e9),
             )
 
         except Exception as e:
@@ -153,20 +158,23 @@ class IPerfChecker(BaseChecker):
             print(f"DOWNLOAD ** {bandwidth_mbps:.2f} Mbps, threads: {thread_count}, duration: {duration_ms:.0f} ms")
 
             # Send download metrics
-            self.client.metric(
-                self.bucket,
-                tags={
+            self.send_point(
+                ('download', server, self.light_overlap),
+                lambda: {
+                    **self.target_tags(server),
                     'type': 'iperf',
                     'direction': 'download',
                     'result': 'success',
                     'server': server,
+                    **self.resource_tags(),
                 },
-                values={
+                {
                     'bandwidth': round(bandwidth_mbps, 2),
                     'threads': thread_count,
                     'bytes': summary['bytes'],
                     'duration': int(duration_ms),
-                }
+                },
+                int(start_time * 1e9),
             )
 
         except Exception as e:
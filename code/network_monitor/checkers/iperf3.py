@@ -1,35 +1,44 @@
-import os
 import time
 import json
-import subprocess
 
-from .base import BaseChecker
+from .base import BaseChecker, RESOURCE_EXCLUSIVE_BANDWIDTH
+from ..resolver import get_resolver
+from ..runner import get_runner
 
 class IPerf3Checker(BaseChecker):
     """iperf3 network performance test"""
 
+    resource_class = RESOURCE_EXCLUSIVE_BANDWIDTH
+    config_section = 'iperf3'
+
     def enabled(self) -> bool:
-        return self.get_boolean_from_string(os.environ.get('IPERF3_ENABLED', 'false'))
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
 
     def check(self) -> int:
-        interval_secs = self.get_timeout('IPERF3_INTERVAL', '1h')
-        max_timeout_secs = self.get_timeout('IPERF3_TIMEOUT', '30s')
-        duration_secs = self.get_timeout('IPERF3_DURATION', '10s')
-        jobs = os.environ.get('IPERF3_JOBS', '1')
+        config = self.config
+        interval_secs = config.interval
+        duration_secs = config.duration
+        jobs = str(config.jobs)
+        run_test = self.run_stream_test if config.stream else self.run_test
 
-        targets = self.get_targets('IPERF3_TARGETS')
+        targets = self.configured_targets()
 
         for server in targets:
+            self.count_probed()
+            max_timeout_secs = self.get_target_timeout(server)
 
             start_time = time.time()
-            data, success = self.run_test('upload', server, max_timeout_secs, duration_secs, jobs)
+            data, success = run_test('upload', server, max_timeout_secs, duration_secs, jobs)
             if success:
                 self.send_upload_metrics(data, start_time, server)
             else:
                 break
 
             start_time = time.time()
-            data, success = self.run_test('download', server, max_timeout_secs, duration_secs, jobs)
+            data, success = run_test('download', server, max_timeout_secs, duration_secs, jobs)
             if success:
                 self.send_download_metrics(data, start_time, server)
             else:
@@ -42,39 +51,32 @@ class IPerf3Checker(BaseChecker):
         """Run iperf3 test with specified direction and return data and success status"""
         try:
             print(f"Running {direction} test to server {server} using {jobs} connection(s)...")
+            address = get_resolver().resolve(server)[0][1]
 
-            if direction == 'upload':
-                cmd = f"iperf3 -c {server} -J --time {duration_secs} -P {jobs}"
-            else:
-                cmd = f"iperf3 -c {server} -J --time {duration_secs} -P {jobs} -R"
-
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                check=True,
-                timeout=max_timeout_secs
-            )
-            
-            data = json.loads(result.stdout.decode('utf-8'))
-            return data, True
+            cmd = ['iperf3', '-c', address, '-J', '--time', str(duration_secs), '-P', jobs]
+            if direction == 'download':
+                cmd.append('-R')
 
-        except subprocess.TimeoutExpired:
-            print(f"** iperf3 {direction} timeout after {max_timeout_secs} seconds")
-            return None, False
+            result = get_runner().run(cmd, timeout=max_timeout_secs)
 
-        except subprocess.CalledProcessError as e:
-            stdout = e.stdout.decode().rstrip() if e.stdout else ""
-            stderr = e.stderr.decode().rstrip() if e.stderr else ""
+            if result.timed_out:
+                print(f"** iperf3 {direction} timeout after {max_timeout_secs} seconds")
+                return None, False
 
-            print(f"** iperf3 {direction} failed (rc: {e.returncode})")
-            if stdout:
-                print(f"STDOUT: {stdout}")
-            if stderr:
-                print(f"STDERR: {stderr}")
+            if result.returncode != 0:
+                stdout = result.stdout.decode().rstrip()
+                stderr = result.stderr.decode().rstrip()
 
-            return None, False
+                print(f"** iperf3 {direction} failed (rc: {result.returncode})")
+                if stdout:
+                    print(f"STDOUT: {stdout}")
+                if stderr:
+                    print(f"STDERR: {stderr}")
+
+                return None, False
+
+            data = json.loads(result.stdout.decode('utf-8'))
+            return data, True
 
         except json.JSONDecodeError as e:
             print(f"** iperf3 {direction} JSON decode error: {e}")
@@ -84,6 +86,130 @@ class IPerf3Checker(BaseChecker):
             print(f"** iperf3 {direction} unexpected error: {e}")
             return None, False
 
+    def run_stream_test(self, direction: str, server: str, max_timeout_secs: int, duration_secs: int, jobs: str) -> tuple:
+        """
+        Run iperf3 test with line-delimited JSON output and send per-interval metrics while it runs
+
+        Returns the final result in the same shape as run_test(). If the test
+        times out or fails halfway, a summary of the intervals received so far
+        is sent instead.
+        """
+        start_time = time.time()
+        intervals = []
+        data = None
+        error = None
+
+        def on_line(line: bytes) -> None:
+            nonlocal data, error
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+            if event.get('event') == 'interval':
+                summary = event.get('data', {}).get('sum', {})
+                intervals.append(summary)
+                self.send_interval_metrics(event['data'], direction, server)
+            elif event.get('event') == 'end':
+                data = {'end': event.get('data', {})}
+            elif event.get('event') == 'error':
+                error = event.get('data')
+
+        try:
+            print(f"Running {direction} test to server {server} using {jobs} connection(s) (streaming)...")
+            address = get_resolver().resolve(server)[0][1]
+
+            cmd = ['iperf3', '-c', address, '--json-stream', '--time', str(duration_secs), '-P', str(jobs)]
+            if direction == 'download':
+                cmd.append('-R')
+
+            # Interval events are handled as iperf3 prints them
+            result = get_runner().run(cmd, timeout=max_timeout_secs, on_line=on_line)
+
+            if result.timed_out:
+                print(f"** iperf3 {direction} timeout after {max_timeout_secs} seconds")
+                self.send_partial_metrics(intervals, start_time, direction, server, 'timeout')
+                return None, False
+
+            if result.returncode != 0 or data is None:
+                stderr = result.stderr.decode().rstrip()
+                print(f"** iperf3 {direction} failed (rc: {result.returncode})")
+                if error:
+                    print(f"ERROR: {error}")
+                if stderr:
+                    print(f"STDERR: {stderr}")
+                self.send_partial_metrics(intervals, start_time, direction, server, 'failed')
+                return None, False
+
+            return data, True
+
+        except Exception as e:
+            print(f"** iperf3 {direction} unexpected error: {e}")
+            self.send_partial_metrics(intervals, start_time, direction, server, 'failed')
+            return None, False
+
+    def send_interval_metrics(self, data: dict, direction: str, server: str) -> None:
+        """Send metrics of a single reporting interval"""
+        summary = data.get('sum', {})
+        values = {
+            'bandwidth': round(summary.get('bits_per_second', 0) / 1_000_000, 2),
+            'bytes': summary.get('bytes', 0),
+        }
+        if 'retransmits' in summary:
+            values['retransmits'] = summary['retransmits']
+
+        # RTT is only reported for the sending side, in microseconds per stream
+        rtts = [stream['rtt'] for stream in data.get('streams', []) if 'rtt' in stream]
+        if rtts:
+            values['rtt'] = round(sum(rtts) / len(rtts) / 1000, 3)
+
+        self.send_point(
+            ('interval', direction, server, self.light_overlap),
+            lambda: {
+                **self.target_tags(server),
+                'type': 'iperf3',
+                'direction': direction,
+                'result': 'interval',
+                'server': server,
+                **self.resource_tags(),
+            },
+            values,
+            time.time_ns(),
+        )
+
+    def send_partial_metrics(self, intervals: list, start_time: float, direction: str, server: str, result: str) -> None:
+        """Send a summary of the intervals received before the test was interrupted"""
+        if not intervals:
+            return
+
+        duration_ms = (time.time() - start_time) * 1000
+        seconds = sum(interval.get('seconds', 0) for interval in intervals)
+        total_bytes = sum(interval.get('bytes', 0) for interval in intervals)
+        bandwidth_mbps = (total_bytes * 8 / seconds / 1_000_000) if seconds else 0.0
+        retransmits = sum(interval.get('retransmits', 0) for interval in intervals)
+
+        print(f"{direction.upper()} ** partial {bandwidth_mbps:.2f} Mbps over {seconds:.1f}s, retransmits: {retransmits}")
+
+        self.send_point(
+            (direction, result, server, self.light_overlap),
+            lambda: {
+                **self.target_tags(server),
+                'type': 'iperf3',
+                'direction': direction,
+                'result': result,
+                'server': server,
+                **self.resource_tags(),
+            },
+            {
+                'bandwidth': round(bandwidth_mbps, 2),
+                'retransmits': retransmits,
+                'bytes': total_bytes,
+                'intervals': len(intervals),
+                'duration': int(duration_ms),
+            },
+            int(start_time * 1e9),
+        )
+
     def send_upload_metrics(self, data: dict, start_time: float, server: str) -> None:
         """Send upload metrics to InfluxDB"""
         duration_ms = (time.time() - start_time) * 1000  # ms
@@ -101,19 +227,22 @@ class IPerf3Checker(BaseChecker):
             print(f"UPLOAD ** {bandwidth_mbps:.2f} Mbps, retransmits: {retransmits}, duration: {duration_ms:.0f} ms")
 
             # Send upload metrics
-            self.client.metric(
-                self.bucket,
-                tags={
+            self.send_point(
+                ('upload', server, self.light_overlap),
+                lambda: {
+                    **self.target_tags(server),
                     'type': 'iperf3',
                     'direction': 'upload',
                     'result': 'success',
                     'server': server,
+                    **self.resource_tags(),
                 },
-                values={
+                {
                     'bandwidth': round(bandwidth_mbps, 2),
                     'retransmits': retransmits,
                     'duration': int(duration_ms),
-                }
+                },
+                int(start_time * 1e9),
             )
 
         except Exception as e:
@@ -138,19 +267,22 @@ class IPerf3Checker(BaseChecker):
             print(f"DOWNLOAD ** {bandwidth_mbps:.2f} Mbps, retransmits: {retransmits}, duration: {duration_ms:.0f} ms")
 
             # Send download metrics
-            self.client.metric(
-                self.bucket,
-                tags={
+            self.send_point(
+                ('download', server, self.light_overlap),
+                lambda: {
+                    **self.target_tags(server),
                     'type': 'iperf3',
                     'direction': 'download',
                     'result': 'success',
                     'server': server,
+                    **self.resource_tags(),
                 },
-                values={
+                {
                     'bandwidth': round(bandwidth_mbps, 2),
                     'retransmits': retransmits,
                     'duration': int(duration_ms),
-                }
+                },
+                int(start_time * 1e9),
             )
 
         except Exception as e:
@@ -1,60 +1,231 @@
-import os
 import time
 import json
-import subprocess
+import socket
+import statistics
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
 
-from .base import BaseChecker
+from .base import BaseChecker, RESOURCE_EXCLUSIVE_BANDWIDTH
+from ..resolver import get_resolver
+from ..runner import get_runner
+
+COMMAND = ['speedtest', '--accept-license', '--accept-gdpr', '--format=json']
+
+# Seconds allowed for listing the servers
+LIST_TIMEOUT = 60
+
+@dataclass(slots=True)
+class SpeedtestServer:
+    id: str
+    host: str
+    port: int
+    name: str = ''
+    location: str = ''
+    # Best TCP connect time in milliseconds, None if unreachable
+    latency: Optional[float] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'SpeedtestServer':
+        host, port = str(data.get('host', '')), int(data.get('port') or 8080)
+        if ':' in host and not host.startswith('['):
+            host, _, port = host.rpartition(':')
+            port = int(port)
+        return cls(str(data['id']), host, port, data.get('name', ''), data.get('location', ''))
+
+def measure_latency(servers: List[SpeedtestServer], timeout: float = 2.0, probes: int = 3) -> None:
+    """Set the latency of every server to its best of probes TCP connects, all servers in parallel"""
+    addresses = get_resolver().resolve_many([server.host for server in servers])
+
+    def probe(server: SpeedtestServer) -> None:
+        resolved = addresses.get(server.host)
+        if not resolved or isinstance(resolved, Exception):
+            return
+        family, address = resolved[0]
+        for _ in range(probes):
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(timeout)
+                    start_time = time.perf_counter()
+                    sock.connect((address, server.port))
+                    latency = (time.perf_counter() - start_time) * 1000
+            except OSError:
+                continue
+            if server.latency is None or latency < server.latency:
+                server.latency = latency
+
+    threads = [threading.Thread(target=probe, args=(server,), daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class ServerCache:
+    """Discovered servers ranked by latency, valid for ttl seconds or until all failed"""
+
+    def __init__(self):
+        self.servers: List[SpeedtestServer] = []
+        self.expires = 0.0
+
+    def valid(self) -> bool:
+        return time.monotonic() < self.expires
+
+    def update(self, servers: List[SpeedtestServer], ttl: float) -> None:
+        """Keep the reachable servers, closest first"""
+        self.servers = sorted((server for server in servers if server.latency is not None),
+                              key=lambda server: server.latency)
+        self.expires = time.monotonic() + ttl
+
+    def best(self) -> Optional[SpeedtestServer]:
+        return self.servers[0] if self.servers else None
+
+    def drop(self, server_id: str) -> None:
+        """Forget a server that failed, the next closest one is used instead"""
+        self.servers = [server for server in self.servers if server.id != server_id]
+        if not self.servers:
+            self.expires = 0.0
 
 class SpeedtestChecker(BaseChecker):
-    """Speedtest by Ookla"""
+    """
+    Speedtest by Ookla
+
+    Without pinned servers the CLI's server list is fetched once per
+    cache_ttl, the nearest candidates are ranked by TCP connect time and
+    every run uses the closest one. Runs stay on the same server, so results
+    are comparable, until the list expires or the server fails. Pinned
+    server IDs are used one per run in turn. The last results of every
+    server give the baseline fields sent with each result.
+    """
+
+    resource_class = RESOURCE_EXCLUSIVE_BANDWIDTH
+    config_section = 'speedtest'
+
+    def __init__(self, name: str = None):
+        super().__init__(name)
+        self.servers = ServerCache()
+        # Next pinned server
+        self._rotation = 0
+        # Server ID -> (download, upload, latency) of the last runs
+        self.history: Dict[str, Deque[tuple]] = {}
 
     def enabled(self) -> bool:
-        return self.get_boolean_from_string(os.environ.get('SPEEDTEST_ENABLED', 'false'))
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
 
     def check(self) -> int:
-        max_timeout_secs = self.get_timeout('SPEEDTEST_TIMEOUT', '300s')
+        max_timeout_secs = self.config.timeout
 
         start_time = time.time()
+        server_id = None
 
         try:
-            print("Start Speedtest by Ookla (timeout {}s)".format(max_timeout_secs))
-            result = subprocess.run(
-                "speedtest --accept-license --accept-gdpr --format=json",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                check=True,
-                timeout=max_timeout_secs
-            )
+            server_id = self.select_server()
+            cmd = list(COMMAND)
+            if server_id is not None:
+                cmd.append(f'--server-id={server_id}')
 
-            data = json.loads(result.stdout.decode('utf-8'))
-            self.send_metrics(data, start_time)
+            self.count_probed()
+            print("Start Speedtest by Ookla (server {}, timeout {}s)".format(server_id or 'auto', max_timeout_secs))
+            result = get_runner().run(cmd, timeout=max_timeout_secs)
 
-        except subprocess.TimeoutExpired:
-            print("** speedtest timeout after {} seconds".format(max_timeout_secs))
-            self.send_timeout_metrics(start_time)
+            if result.timed_out:
+                print("** speedtest timeout after {} seconds".format(max_timeout_secs))
+                self.server_failed(server_id)
+                self.send_timeout_metrics(start_time, server_id)
 
-        except subprocess.CalledProcessError as e:
-            stdout = e.stdout.decode().rstrip() if e.stdout else ""
-            stderr = e.stderr.decode().rstrip() if e.stderr else ""
+            elif result.returncode != 0:
+                stdout = result.stdout.decode().rstrip()
+                stderr = result.stderr.decode().rstrip()
 
-            print(f"** speedtest failed (rc: {e.returncode})")
-            if stdout:
-                print(f"STDOUT: {stdout}")
-            if stderr:
-                print(f"STDERR: {stderr}")
+                print(f"** speedtest failed (rc: {result.returncode})")
+                if stdout:
+                    print(f"STDOUT: {stdout}")
+                if stderr:
+                    print(f"STDERR: {stderr}")
 
-            self.send_error_metrics(start_time, e.returncode)
+                self.server_failed(server_id)
+                self.send_error_metrics(start_time, result.returncode, server_id)
+
+            else:
+                data = json.loads(result.stdout.decode('utf-8'))
+                self.send_metrics(data, start_time)
 
         except json.JSONDecodeError as e:
             print(f"** speedtest JSON decode error: {e}")
-            self.send_error_metrics(start_time, "json_error")
+            self.send_error_metrics(start_time, "json_error", server_id)
 
         except Exception as e:
             print(f"** speedtest unexpected error: {e}")
-            self.send_error_metrics(start_time, "unexpected_error")
+            self.send_error_metrics(start_time, "unexpected_error", server_id)
+
+        return self.get_interval()
+
+    def select_server(self) -> Optional[str]:
+        """Server ID for this run, None lets the CLI choose"""
+        config = self.config
+        if config.servers:
+            server_id = config.servers[self._rotation % len(config.servers)]
+            self._rotation += 1
+            return server_id
+
+        if not self.servers.valid():
+            self.discover_servers()
+        server = self.servers.best()
+        return server.id if server is not None else None
+
+    def discover_servers(self) -> None:
+        """Fetch the server list and rank the nearest candidates by latency"""
+        config = self.config
+        result = get_runner().run(COMMAND + ['--servers'], timeout=min(config.timeout, LIST_TIMEOUT))
+        if not result.ok:
+            print(f"** speedtest server list failed (rc: {result.returncode}), server chosen by the CLI")
+            # Retried at the next run
+            self.servers.update([], 0)
+            return
+
+        try:
+            data = json.loads(result.stdout.decode('utf-8'))
+            # Listed closest first by the CLI
+            candidates = [SpeedtestServer.from_json(server) for server in data.get('servers', [])[:config.candidates]]
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            # JSONDecodeError is a ValueError
+            print(f"** speedtest server list unreadable ({e!r}), server chosen by the CLI")
+            self.servers.update([], 0)
+            return
+        measure_latency(candidates)
+        self.servers.update(candidates, config.cache_ttl)
+
+        ranked = ', '.join(f"{server.id} {server.latency:.1f} ms" for server in self.servers.servers)
+        print(f"Speedtest servers: {ranked or 'none reachable'} (of {len(candidates)}, cached {config.cache_ttl}s)")
 
-        return self.get_timeout('SPEEDTEST_INTERVAL', '1h')  # ← Исправить название переменной
+    def server_failed(self, server_id: Optional[str]) -> None:
+        """Move on to the next closest discovered server, pinned servers stay in the rotation"""
+        if server_id is not None and not self.config.servers:
+            self.servers.drop(server_id)
+
+    def record_history(self, server_id: str, download: float, upload: float, latency: float) -> Dict[str, float]:
+        """
+        Add a result to the history of the server
+
+        Returns:
+            dict: Median download, upload and latency of the previous results, empty for the first
+        """
+        history = self.history.get(server_id)
+        if history is None or history.maxlen != self.config.history:
+            history = self.history[server_id] = deque(history or (), maxlen=max(1, self.config.history))
+
+        baseline = {}
+        if history:
+            baseline = {
+                'download_baseline': round(statistics.median(entry[0] for entry in history), 2),
+                'upload_baseline': round(statistics.median(entry[1] for entry in history), 2),
+                'ping_baseline': round(statistics.median(entry[2] for entry in history), 2),
+            }
+        history.append((download, upload, latency))
+        return baseline
 
     def send_metrics(self, data: dict, start_time: float) -> None:
         """Send speedtest metrics to InfluxDB"""
@@ -68,23 +239,29 @@ class SpeedtestChecker(BaseChecker):
             ping_high = data.get('ping', {}).get('high')
             ping_low = data.get('ping', {}).get('low')
             packet_loss = data.get('packetLoss')
-            host = data.get('server', {}).get('host', 'unknown')
+            server = data.get('server', {})
+            host = server.get('host', 'unknown')
+            server_id = str(server.get('id', 'unknown'))
 
             # Convert bits/s to Mbps
             download_mbps = (float(download) * 8 / 1_000_000) if download else 0.0
             upload_mbps = (float(upload) * 8 / 1_000_000) if upload else 0.0
+            baseline = self.record_history(server_id, download_mbps, upload_mbps, ping_latency or 0.0)
 
-            print('{:30} ** success {:.1f} ms'.format('Speedtest by Ookla', duration_ms))
-            print(json.dumps(data, indent=2))
+            print('{:30} ** success {:.1f} ms, server {} ({}), down {:.1f} Mbps, up {:.1f} Mbps, ping {:.1f} ms, loss {}'.format(
+                'Speedtest by Ookla', duration_ms, server_id, host, download_mbps, upload_mbps,
+                ping_latency or 0.0, packet_loss or 0))
 
-            self.client.metric(
-                self.bucket,
-                tags={
+            self.send_point(
+                ('success', self.light_overlap),
+                lambda: {
                     'type': 'speedtest',
                     'result': 'success',
+                    **self.resource_tags(),
                 },
-                values={
+                {
                     'server': host,
+                    'server_id': server_id,
                     'download': round(download_mbps, 2),
                     'upload': round(upload_mbps, 2),
                     'ping_latency': round(ping_latency, 2) if ping_latency else 0,
@@ -93,39 +270,49 @@ class SpeedtestChecker(BaseChecker):
                     'ping_low': round(ping_low, 2) if ping_low else 0,
                     'packet_loss': int(packet_loss) if packet_loss else 0,
                     'duration': int(duration_ms),
-                }
+                    **baseline,
+                },
+                int(start_time * 1e9),
             )
 
         except Exception as e:
             print(f"Failed to send speedtest metrics: {e}")
 
-    def send_timeout_metrics(self, start_time: float) -> None:
+    def send_timeout_metrics(self, start_time: float, server_id: str = None) -> None:
         """Send timeout metrics"""
         duration_ms = (time.time() - start_time) * 1000
+        server_id = server_id or 'auto'
 
-        self.client.metric(
-            self.bucket,
-            tags={
+        self.send_point(
+            ('timeout', self.light_overlap),
+            lambda: {
                 'type': 'speedtest',
                 'result': 'timeout',
+                **self.resource_tags(),
             },
-            values={
+            {
+                'server_id': server_id,
                 'duration': int(duration_ms),
-            }
+            },
+            int(start_time * 1e9),
         )
 
-    def send_error_metrics(self, start_time: float, error_type: str) -> None:
+    def send_error_metrics(self, start_time: float, error_type: str, server_id: str = None) -> None:
         """Send error metrics"""
         duration_ms = (time.time() - start_time) * 1000
+        server_id = server_id or 'auto'
 
-        self.client.metric(
-            self.bucket,
-            tags={
+        self.send_point(
+            ('error', self.light_overlap),
+            lambda: {
                 'type': 'speedtest',
                 'result': 'error',
+                **self.resource_tags(),
             },
-            values={
+            {
                 'error_type': str(error_type),
+                'server_id': server_id,
                 'duration': int(duration_ms),
-            }
+            },
+            int(start_time * 1e9),
         )
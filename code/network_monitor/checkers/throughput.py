@@ -0,0 +1,85 @@
+import time
+
+from .base import BaseChecker, RESOURCE_EXCLUSIVE_BANDWIDTH
+from ..engines.throughput import ThroughputClient, UPLOAD, DOWNLOAD, DEFAULT_PORT
+from ..resolver import get_resolver
+
+def split_server(server: str) -> tuple:
+    """Split host[:port] or [IPv6]:port, a bare IPv6 address has no port"""
+    if server.startswith('['):
+        host, _, port = server[1:].partition(']')
+        return host, port.lstrip(':')
+    if server.count(':') != 1:
+        return server, ''
+    host, _, port = server.rpartition(':')
+    return host, port
+
+class ThroughputChecker(BaseChecker):
+    """Built-in TCP throughput test against a network-monitor server"""
+
+    resource_class = RESOURCE_EXCLUSIVE_BANDWIDTH
+    config_section = 'throughput'
+
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def get_interval(self) -> int:
+        return self.config.interval
+
+    def check(self) -> int:
+        config = self.config
+        interval_secs = config.interval
+        duration_secs = config.duration
+        streams = config.streams
+        client = ThroughputClient(buffer_size=config.buffer_size, timeout=config.timeout)
+
+        targets = self.configured_targets()
+
+        for server in targets:
+            self.count_probed()
+            client.timeout = self.get_target_timeout(server)
+            host, port = split_server(server)
+            for direction, name in ((UPLOAD, 'upload'), (DOWNLOAD, 'download')):
+                start_time = time.time()
+                try:
+                    print(f"Running {name} test to server {server} using {streams} connection(s)...")
+                    address = get_resolver().resolve(host)[0][1]
+                    result = client.run(address, int(port or DEFAULT_PORT), duration_secs, streams, direction)
+                except Exception as e:
+                    print(f"** throughput {name} failed: {e}")
+                    self.send_metrics(server, name, 'failed', start_time)
+                    break
+
+                self.send_metrics(server, name, 'success', start_time, result)
+
+        return interval_secs
+
+    def send_metrics(self, server: str, direction: str, result: str, start_time: float, data=None) -> None:
+        """Send throughput metrics to InfluxDB"""
+        duration_ms = (time.time() - start_time) * 1000
+        values = {
+            'duration': int(duration_ms),
+        }
+
+        if data is not None:
+            bandwidth_mbps = data.bits_per_second / 1_000_000
+            print(f"{direction.upper()} ** {bandwidth_mbps:.2f} Mbps, threads: {data.streams}, duration: {duration_ms:.0f} ms")
+            values.update({
+                'bandwidth': round(bandwidth_mbps, 2),
+                'threads': data.streams,
+                'bytes': data.bytes,
+            })
+
+        self.send_point(
+            (direction, result, server, self.light_overlap),
+            lambda: {
+                **self.target_tags(server),
+                'type': 'throughput',
+                'direction': direction,
+                'result': result,
+                'server': server,
+                **self.resource_tags(),
+            },
+            values,
+            int(start_time * 1e9),
+        )
@@ -1,20 +1,281 @@
-import socket
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
 from telegraf.client import ClientBase
+from .config import parse_list
+from .lineprotocol import SeriesCache, encode_line
+from .sharding import get_shard
+from .sinks import Sink, TcpSink, UdpSink, UnixSink, InfluxDBSink
+from .spool import MetricSpool
 
 class TelegrafClient(ClientBase):
-    def __init__(self, host='localhost', port=8086, tags=None):
+    """
+    Metrics client with an in-memory buffer in front of one or more sinks.
+
+    Lines are collected by send() and handed to every sink as one batch
+    once the buffer exceeds batch_size bytes or flush_interval seconds
+    elapse. Sinks queue batches and deliver them on their own threads, so
+    probes never wait for a destination and a slow sink does not hold back
+    the others. Without sinks the client writes to Telegraf over TCP at
+    host:port, spooling undelivered batches to spool if given.
+
+    Lines are encoded by the native encoder in lineprotocol.py rather than
+    pytelegraf's Line, write() takes a precompiled series prefix.
+    """
+
+    def __init__(self, host='localhost', port=8086, tags=None,
+                 batch_size: int = 64 * 1024, flush_interval: float = 1.0,
+                 max_buffer: int = 10000, timeout: float = 5.0,
+                 spool: Optional[MetricSpool] = None, sinks: List[Sink] = None):
         super(TelegrafClient, self).__init__(host, port, tags)
 
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.timeout = timeout
+        self.sinks = sinks or [TcpSink(host, port, spool=spool, timeout=timeout)]
+
+        self._dropped_lines = 0
+        self._series: Dict[str, SeriesCache] = {}
+        self._buffer: Deque[bytes] = deque()
+        self._buffer_bytes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def buffered_lines(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def sent_lines(self) -> int:
+        """Lines delivered, counted once per sink"""
+        return sum(sink.sent_lines for sink in self.sinks)
+
+    @property
+    def dropped_lines(self) -> int:
+        return self._dropped_lines + sum(sink.dropped_lines for sink in self.sinks)
+
+    @property
+    def send_errors(self) -> int:
+        return sum(sink.send_errors for sink in self.sinks)
+
+    @property
+    def send_batches(self) -> int:
+        return sum(sink.send_batches for sink in self.sinks)
+
+    @property
+    def send_seconds(self) -> float:
+        return sum(sink.send_seconds for sink in self.sinks)
+
+    def metric(self, measurement_name, values, tags=None, timestamp=None):
+        """
+        Timestamp the metric when it is created, so spooled lines keep their original time
+
+        The series prefix is cached by measurement and tag items, so repeated
+        tag sets are not sorted and escaped again.
+        """
+        if not measurement_name or values in (None, {}):
+            return
+        series = self._series.get(measurement_name)
+        if series is None:
+            series = self._series[measurement_name] = SeriesCache(measurement_name, self.tags)
+        tags = tags or {}
+        self.write(series.prefix(tuple(tags.items()), tags), values, timestamp)
+
+    def series(self, measurement_name: str) -> SeriesCache:
+        """New prefix cache for the measurement including the global tags of the client"""
+        return SeriesCache(measurement_name, self.tags)
+
+    def write(self, prefix: str, values, timestamp: int = None) -> None:
+        """
+        Send one sample of a precompiled series, timestamp in nanoseconds (now if None)
+
+        The number of calls and the time spent in them are counted per thread,
+        see thread_stats().
+        """
+        start_time = time.perf_counter()
+        line = encode_line(prefix, values, timestamp if timestamp is not None else time.time_ns())
+        if line is not None:
+            self.send(line)
+
+        local = self._local
+        local.calls = getattr(local, 'calls', 0) + 1
+        local.seconds = getattr(local, 'seconds', 0.0) + time.perf_counter() - start_time
+
+    def thread_stats(self) -> Tuple[int, float]:
+        """Number of metric() and write() calls on the current thread and seconds spent in them"""
+        return getattr(self._local, 'calls', 0), getattr(self._local, 'seconds', 0.0)
+
     def send(self, data):
         """
-        Sends the given data to the socket via TCP
+        Appends the given line to the buffer, the actual write is done by the flusher
+        """
+        line = data.encode('utf8') + b'\n'
+
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                # Drop the oldest line, fresh data is more valuable
+                self._buffer_bytes -= len(self._buffer.popleft())
+                self._dropped_lines += 1
+
+            self._buffer.append(line)
+            self._buffer_bytes += len(line)
+
+            if self._buffer_bytes >= self.batch_size:
+                self._flush_event.set()
+
+    def flush(self, wait: bool = False) -> bool:
+        """
+        Hands all buffered lines to the sinks in one batch
+
+        Args:
+            wait: Block until the sinks delivered, spooled or dropped their queued batches
+
+        Returns:
+            bool: False if waiting timed out
         """
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            self.socket.sendall(data.encode('utf8') + b'\n')
-            self.socket.close()
+        with self._flush_lock:
+            with self._lock:
+                lines, self._buffer, self._buffer_bytes = self._buffer, deque(), 0
+
+            if lines:
+                payload = b''.join(lines)
+                for sink in self.sinks:
+                    sink.submit(payload, len(lines))
+
+        if wait:
+            return all([sink.drain() for sink in self.sinks])
+        return True
+
+    def close(self) -> None:
+        """Flush pending lines and close the sinks"""
+        self._stop_event.set()
+        self._flush_event.set()
+        self._thread.join(timeout=self.timeout * 2)
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+    def get_stats(self) -> dict:
+        """Get transport counters, totals over all sinks"""
+        return {
+            'sent': self.sent_lines,
+            'dropped': self.dropped_lines,
+            'buffered': self.buffered_lines,
+            'errors': self.send_errors,
+            'batches': self.send_batches,
+            'send_seconds': round(self.send_seconds, 6),
+            'sinks': {str(sink): sink.get_stats() for sink in self.sinks},
+        }
+
+    def _flush_loop(self) -> None:
+        """Background thread flushing the buffer on size or time limit"""
+        while not self._stop_event.is_set():
+            self._flush_event.wait(timeout=self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+
+_client: Optional[TelegrafClient] = None
+_client_lock = threading.Lock()
+
+SINKS = ('tcp', 'udp', 'unix', 'influxdb')
+
+def create_spool(path: str) -> Optional[MetricSpool]:
+    try:
+        spool = MetricSpool(
+            path,
+            segment_size=int(os.environ.get('SPOOL_SEGMENT_SIZE', str(4 * 1024 * 1024))),
+            max_size=int(os.environ.get('SPOOL_MAX_SIZE', str(256 * 1024 * 1024))),
+        )
+        print(f'Spooling undelivered metrics to {path}')
+        return spool
+    except OSError as e:
+        print(f'Spool disabled, cannot use {path}: {e}')
+        return None
+
+def create_sink(name: str, spool: Optional[MetricSpool] = None) -> Sink:
+    """
+    Create a sink from its environment settings
+
+    Raises:
+        ValueError: Unknown sink or invalid setting
+    """
+    host = str(os.environ.get('INFLUXDB_HOST', 'localhost'))
+    options = {
+        'spool': spool,
+        'max_pending': int(os.environ.get('SINK_MAX_PENDING', '64')),
+        'timeout': float(os.environ.get('SINK_TIMEOUT', '5')),
+    }
+
+    if name == 'tcp':
+        return TcpSink(host, int(os.environ.get('INFLUXDB_PORT', '8086')), **options)
+    if name == 'udp':
+        return UdpSink(
+            str(os.environ.get('UDP_HOST', host)),
+            int(os.environ.get('UDP_PORT', '8094')),
+            mtu=int(os.environ.get('UDP_MTU', '1500')),
+            **options,
+        )
+    if name == 'unix':
+        return UnixSink(str(os.environ.get('UNIX_SOCKET', '/var/run/telegraf.sock')), **options)
+    if name == 'influxdb':
+        return InfluxDBSink(
+            str(os.environ.get('INFLUXDB_V2_URL', f'http://{host}:8086')),
+            org=str(os.environ.get('INFLUXDB_V2_ORG', '')),
+            bucket=str(os.environ.get('INFLUXDB_V2_BUCKET', '')),
+            token=str(os.environ.get('INFLUXDB_V2_TOKEN', '')),
+            gzip_level=int(os.environ.get('INFLUXDB_V2_GZIP_LEVEL', '6')),
+            retries=int(os.environ.get('INFLUXDB_V2_RETRIES', '3')),
+            workers=int(os.environ.get('INFLUXDB_V2_CONNECTIONS', '2')),
+            **options,
+        )
+    raise ValueError(f"unknown sink '{name}', expected one of {', '.join(SINKS)}")
+
+def get_client() -> TelegrafClient:
+    """Get the process-wide client with the sinks listed in SINKS, created on first use"""
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            names = tuple(dict.fromkeys(parse_list(os.environ.get('SINKS', 'tcp').replace(',', ';')))) or ('tcp',)
+
+            # With several sinks every one spools to its own directory
+            spool_dir = os.environ.get('SPOOL_DIR', '')
+            sinks = []
+            for name in names:
+                spool = None
+                if spool_dir:
+                    spool = create_spool(spool_dir if len(names) == 1 else os.path.join(spool_dir, name))
+                sinks.append(create_sink(name, spool))
+
+            _client = TelegrafClient(
+                str(os.environ.get('INFLUXDB_HOST', 'localhost')),
+                int(os.environ.get('INFLUXDB_PORT', '8086')),
+                # Every metric of a sharded instance carries its shard
+                tags=get_shard().tags(),
+                batch_size=int(os.environ.get('INFLUXDB_BATCH_SIZE', str(64 * 1024))),
+                flush_interval=float(os.environ.get('INFLUXDB_FLUSH_INTERVAL', '1')),
+                max_buffer=int(os.environ.get('INFLUXDB_MAX_BUFFER', '10000')),
+                sinks=sinks,
+            )
+            print(f"Created client: {', '.join(str(sink) for sink in sinks)}")
+
+        return _client
+
+def close_client() -> None:
+    """Flush and close the process-wide client if it was created"""
+    global _client
 
-        except (socket.error, RuntimeError):
-            # Socket errors should fail silently so they don't affect anything else
-            pass
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            print(f'Closed client: sent {_client.sent_lines}, dropped {_client.dropped_lines} lines')
+            _client = None
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Sequence, Tuple
+
+def parse_seconds(value: str) -> int:
+    """Convert a duration like 30, 30s, 5m or 1h to seconds"""
+    value = value.strip()
+    if value.endswith('s'):
+        return int(value[:-1])
+    elif value.endswith('m'):
+        return int(value[:-1]) * 60
+    elif value.endswith('h'):
+        return int(value[:-1]) * 3600
+    else:
+        return int(value)
+
+def parse_duration(value: str) -> float:
+    """Convert a short duration like 100ms, 0.5s or 0.25 (seconds) to seconds"""
+    value = value.strip()
+    if value.endswith('ms'):
+        return float(value[:-2]) / 1000
+    if value.endswith('s'):
+        return float(value[:-1])
+    return float(value)
+
+def parse_boolean(value: str) -> bool:
+    """Convert string to boolean"""
+    if isinstance(value, bool):
+        return value
+    return value.strip().lower() in ('true', '1', 't', 'y', 'yes', 'on', 'enable', 'enabled')
+
+def parse_list(value: str) -> Tuple[str, ...]:
+    """Split a ';' separated list, empty items are skipped"""
+    return tuple(filter(None, [item.strip() for item in value.split(';')]))
+
+def parse_statuses(value: str) -> FrozenSet[int]:
+    """Parse a ';' separated list of HTTP status codes"""
+    return frozenset(int(status) for status in parse_list(value))
+
+def parse_optional_int(value: str) -> Optional[int]:
+    return int(value) if value.strip() else None
+
+def parse_positive_int(value: str) -> int:
+    """Parse an integer of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise ValueError('must be at least 1')
+    return number
+
+def option(default, parse: Callable = None):
+    """Dataclass field read from <PREFIX>_<NAME>, parsed with parse (the type of default by default)"""
+    return field(default=default, metadata={'parse': parse})
+
+@dataclass(frozen=True, slots=True)
+class PingConfig:
+    enabled: bool = option(False)
+    targets: Tuple[str, ...] = option((), parse_list)
+    interval: int = option(60, parse_seconds)
+    timeout: int = option(5, parse_seconds)
+    # Echo requests per target and cycle, more than one reports loss, jitter and percentiles
+    count: int = option(1)
+    spacing: float = option(0.2, parse_duration)
+
+@dataclass(frozen=True, slots=True)
+class HttpConfig:
+    enabled: bool = option(False)
+    targets: Tuple[str, ...] = option((), parse_list)
+    interval: int = option(60, parse_seconds)
+    timeout: int = option(5, parse_seconds)
+    # Defaults to the interval
+    deadline: Optional[int] = option(None, parse_seconds)
+    expected_status: FrozenSet[int] = option(frozenset({200, 301}), parse_statuses)
+    concurrency: int = option(10)
+    keepalive: bool = option(False)
+    verify: bool = option(True)
+    max_bytes: Optional[int] = option(None, parse_optional_int)
+    chunk_size: int = option(64 * 1024)
+    throughput: bool = option(False)
+
+@dataclass(frozen=True, slots=True)
+class SpeedtestConfig:
+    enabled: bool = option(False)
+    interval: int = option(3600, parse_seconds)
+    timeout: int = option(300, parse_seconds)
+    # Pinned server IDs, one per run in turn, the closest discovered server when empty
+    servers: Tuple[str, ...] = option((), parse_list)
+    # Lifetime of the discovered server list and its latency ranking
+    cache_ttl: int = option(86400, parse_seconds)
+    # Discovered servers whose latency is measured
+    candidates: int = option(5)
+    # Results kept per server for the baseline fields
+    history: int = option(24)
+
+@dataclass(frozen=True, slots=True)
+class IPerfConfig:
+    enabled: bool = option(False)
+    targets: Tuple[str, ...] = option((), parse_list)
+    interval: int = option(3600, parse_seconds)
+    timeout: int = option(30, parse_seconds)
+    duration: int = option(10, parse_seconds)
+    jobs: int = option(1)
+    # iperf3 only
+    stream: bool = option(False)
+
+@dataclass(frozen=True, slots=True)
+class ThroughputConfig:
+    enabled: bool = option(False)
+    targets: Tuple[str, ...] = option((), parse_list)
+    interval: int = option(3600, parse_seconds)
+    timeout: int = option(10, parse_seconds)
+    duration: int = option(10, parse_seconds)
+    streams: int = option(1, parse_positive_int)
+    buffer_size: int = option(128 * 1024)
+
+@dataclass(frozen=True, slots=True)
+class HealthConfig:
+    # Circuit breaker and adaptive cadence of targets, see health.py
+    enabled: bool = option(False)
+    # Consecutive failures that open the circuit of a target
+    failure_threshold: int = option(3)
+    # Multiplier of the interval for every failed trial of an open target
+    backoff: int = option(2)
+    # Cadence bounds, fast probes after a change and the longest backoff
+    min_interval: int = option(10, parse_seconds)
+    max_interval: int = option(3600, parse_seconds)
+    boost_probes: int = option(5)
+    # Timeout of the half-open trial probe of an open target
+    trial_timeout: int = option(2, parse_seconds)
+
+# Config attribute -> section class and prefix of its variables
+SECTIONS = {
+    'ping': (PingConfig, 'PING'),
+    'http': (HttpConfig, 'HTTP'),
+    'https': (HttpConfig, 'HTTPS'),
+    'speedtest': (SpeedtestConfig, 'SPEEDTEST'),
+    'iperf': (IPerfConfig, 'IPERF'),
+    'iperf3': (IPerfConfig, 'IPERF3'),
+    'throughput': (ThroughputConfig, 'THROUGHPUT'),
+    'health': (HealthConfig, 'HEALTH'),
+}
+
+PARSERS = {
+    bool: parse_boolean,
+    int: int,
+    str: str,
+}
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """
+    Checker settings parsed and validated once.
+
+    Every section is read from <PREFIX>_<OPTION> variables, e.g. PING_TARGETS
+    or HTTPS_EXPECTED_STATUS. Instances are immutable, a reload builds a new
+    Config and swaps it in as a whole.
+    """
+    ping: PingConfig = PingConfig()
+    http: HttpConfig = HttpConfig()
+    https: HttpConfig = HttpConfig()
+    speedtest: SpeedtestConfig = SpeedtestConfig()
+    iperf: IPerfConfig = IPerfConfig()
+    iperf3: IPerfConfig = IPerfConfig()
+    throughput: ThroughputConfig = ThroughputConfig()
+    health: HealthConfig = HealthConfig()
+
+    @classmethod
+    def from_mapping(cls, values: Mapping[str, str]) -> 'Config':
+        """
+        Build the config from environment-style variables
+
+        Raises:
+            ValueError: A variable has an invalid value, the message names it
+        """
+        return cls(**{name: parse_section(section, prefix, values)
+                      for name, (section, prefix) in SECTIONS.items()})
+
+def parse_section(section: type, prefix: str, values: Mapping[str, str]):
+    """Parse the variables of one section, unset ones keep their default"""
+    options = {}
+    for option_field in fields(section):
+        key = f'{prefix}_{option_field.name.upper()}'
+        if key not in values:
+            continue
+        parse = option_field.metadata.get('parse') or PARSERS[type(option_field.default)]
+        try:
+            options[option_field.name] = parse(values[key])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{key}: invalid value {values[key]!r} ({e})") from None
+    return section(**options)
+
+def read_env_file(path: str) -> Dict[str, str]:
+    """Read KEY=VALUE lines, '#' comments and blank lines are skipped"""
+    values = {}
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('export '):
+                line = line[7:]
+            key, separator, value = line.partition('=')
+            if not separator:
+                raise ValueError(f"{path}:{number}: expected KEY=VALUE")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            values[key.strip()] = value
+    return values
+
+def load_config(path: str = None) -> Config:
+    """
+    Load the config from the environment, values in the file at path take precedence
+
+    Raises:
+        ValueError: Invalid value or malformed file
+        OSError: The file cannot be read
+    """
+    values = dict(os.environ)
+    if path:
+        values.update(read_env_file(path))
+    return Config.from_mapping(values)
+
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+def config_path() -> str:
+    """Optional KEY=VALUE file given by CONFIG_FILE"""
+    return os.environ.get('CONFIG_FILE', '')
+
+def get_config() -> Config:
+    """Get the current config, loaded on first use"""
+    global _config
+
+    config = _config
+    if config is not None:
+        return config
+
+    with _config_lock:
+        if _config is None:
+            _config = load_config(config_path())
+        return _config
+
+def reload_config() -> Optional[Config]:
+    """
+    Reload the config and swap it in atomically
+
+    Returns:
+        Config: The new config, None if it is invalid and the current one was kept
+    """
+    global _config
+
+    try:
+        config = load_config(config_path())
+    except (OSError, ValueError) as e:
+        print(f"Config reload failed, keeping the current config: {e}")
+        return None
+
+    with _config_lock:
+        _config = config
+    print("Config reloaded")
+    return config
+
+def watch_config(callback: Callable[[], None], interval: float = 5.0,
+                 paths: Sequence[str] = None) -> Optional[threading.Thread]:
+    """
+    Call callback whenever the modification time of one of the files changes, polled every interval seconds
+
+    Args:
+        paths: Files to watch, CONFIG_FILE by default, empty entries are ignored
+    """
+    paths = [path for path in (paths if paths is not None else [config_path()]) if path]
+    if not paths:
+        return None
+
+    def mtimes() -> List[Optional[int]]:
+        result = []
+        for path in paths:
+            try:
+                result.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                result.append(None)
+        return result
+
+    def loop() -> None:
+        last = mtimes()
+        while True:
+            time.sleep(interval)
+            current = mtimes()
+            if current != last:
+                last = current
+                callback()
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,19 @@
+"""
+Probe engines shared by the Network Monitoring checkers
+"""
+
+__version__ = "1.0.0"
+
+from .icmp import Pinger, BurstStats
+from .http import HttpProbe, HttpResult
+from .throughput import ThroughputClient, ThroughputServer, ThroughputResult
+
+__all__ = [
+    'Pinger',
+    'BurstStats',
+    'HttpProbe',
+    'HttpResult',
+    'ThroughputClient',
+    'ThroughputServer',
+    'ThroughputResult',
+]
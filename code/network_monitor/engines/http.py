@@ -0,0 +1,307 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from ..resolver import get_resolver
+
+USER_AGENT = 'network-monitor'
+
+REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+
+@dataclass
+class HttpResult:
+    """Outcome of a single HTTP probe, all times in milliseconds"""
+    url: str
+    status_code: Optional[int] = None
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+    dns_ms: Optional[float] = None
+    connect_ms: Optional[float] = None
+    tls_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    transfer_ms: Optional[float] = None
+    reused: bool = False
+    bytes_read: int = 0
+    # Target of a redirect response
+    location: Optional[str] = None
+    # Wall-clock start of the probe in nanoseconds
+    timestamp: Optional[int] = None
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Body download rate in bytes per second, None if nothing was transferred"""
+        if not self.bytes_read or not self.transfer_ms:
+            return None
+        return self.bytes_read / (self.transfer_ms / 1000)
+
+    def phases(self) -> Dict[str, float]:
+        """Measured phase durations by name"""
+        return {name: round(getattr(self, f'{name}_ms'), 3)
+                for name in ('dns', 'connect', 'tls', 'ttfb', 'transfer')
+                if getattr(self, f'{name}_ms') is not None}
+
+class TimedHTTPResponse(http.client.HTTPResponse):
+    """HTTP response recording the arrival of the status line"""
+
+    first_byte_time: Optional[float] = None
+
+    def _read_status(self):
+        status = super()._read_status()
+        self.first_byte_time = time.perf_counter()
+        return status
+
+class TimedHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection recording DNS (through the shared resolver cache) and TCP connect time"""
+
+    response_class = TimedHTTPResponse
+
+    def connect(self):
+        start_time = time.perf_counter()
+        addresses = get_resolver().resolve(self.host)
+        resolved_time = time.perf_counter()
+
+        error = None
+        for family, address in addresses:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect((address, self.port))
+                break
+            except OSError as e:
+                sock.close()
+                sock, error = None, e
+        if sock is None:
+            raise error
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.dns_time = resolved_time - start_time
+        self.connect_time = time.perf_counter() - resolved_time
+        self.tls_time = None
+
+class TimedHTTPSConnection(TimedHTTPConnection):
+    """HTTPS connection recording DNS, TCP connect and TLS handshake time"""
+
+    default_port = http.client.HTTPS_PORT
+
+    def __init__(self, host, port=None, timeout=None, context: ssl.SSLContext = None):
+        super().__init__(host, port, timeout)
+        self.context = context or ssl.create_default_context()
+
+    def connect(self):
+        super().connect()
+        start_time = time.perf_counter()
+        self.sock = self.context.wrap_socket(self.sock, server_hostname=self.host)
+        self.tls_time = time.perf_counter() - start_time
+
+class HttpProbe:
+    """
+    Concurrent HTTP probe engine.
+
+    Requests run on a bounded thread pool. With keepalive enabled, idle
+    connections are pooled per host and reused between cycles.
+    Without keepalive every probe pays the full connect and TLS handshake.
+    Each phase (DNS, connect, TLS, time to first byte and transfer) is timed
+    with time.perf_counter(). Redirects are followed up to max_redirects
+    hops, as requests did, the result has the status of the last hop and
+    every phase summed over all hops.
+
+    The body is streamed in chunk_size pieces into a buffer reused by the
+    worker thread and is never kept. Reading stops after max_bytes bytes,
+    0 stops right after the headers and None reads the whole body.
+    """
+
+    def __init__(self, concurrency: int = 10, keepalive: bool = False, verify: bool = True,
+                 max_bytes: Optional[int] = None, chunk_size: int = 64 * 1024, max_redirects: int = 10):
+        self.concurrency = max(1, concurrency)
+        self.max_redirects = max_redirects
+        self.keepalive = keepalive
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.context = ssl.create_default_context()
+        if not verify:
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+        self._idle: Dict[Tuple[str, str, int], List[TimedHTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='http-probe')
+
+    def probe(self, urls: Sequence[str], timeout: float, deadline: float,
+              timeouts: Sequence[float] = None) -> List[HttpResult]:
+        """
+        Send GET requests to all urls concurrently
+
+        Args:
+            urls: Urls to probe
+            timeout: Per-request connect and read timeout in seconds
+            deadline: Seconds after which unfinished probes are reported as failed
+            timeouts: Optional timeout of every url, overrides timeout
+
+        Returns:
+            list: Results in the same order as urls
+        """
+        if timeouts is None:
+            timeouts = [timeout] * len(urls)
+        timestamp = time.time_ns()
+        futures = [self._executor.submit(self._probe, url, url_timeout) for url, url_timeout in zip(urls, timeouts)]
+        done, _ = wait(futures, timeout=deadline)
+
+        results = []
+        for url, future in zip(urls, futures):
+            if future in done:
+                results.append(future.result())
+            else:
+                future.cancel()
+                results.append(HttpResult(url, duration_ms=deadline * 1000, timestamp=timestamp,
+                                          error=f'deadline of {deadline}s exceeded'))
+        return results
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _buffer(self) -> memoryview:
+        """Receive buffer of the current worker thread"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = memoryview(bytearray(self.chunk_size))
+        return buffer
+
+    def _read_body(self, response: http.client.HTTPResponse) -> Tuple[int, bool]:
+        """
+        Stream the body into the reused buffer
+
+        Returns:
+            tuple: Number of bytes read and whether the body was read to the end
+        """
+        buffer = self._buffer()
+        limit = self.max_bytes
+        total = 0
+
+        while limit is None or total < limit:
+            size = len(buffer) if limit is None else min(len(buffer), limit - total)
+            count = response.readinto(buffer[:size])
+            if not count:
+                return total, True
+            total += count
+
+        return total, response.isclosed()
+
+    def _acquire(self, key: tuple) -> Optional[TimedHTTPConnection]:
+        """Take an idle connection from the pool"""
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _release(self, key: tuple, connection: TimedHTTPConnection) -> None:
+        """Return a connection to the pool, the pool is capped by the concurrency"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.concurrency:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _probe(self, url: str, timeout: float) -> HttpResult:
+        """Probe url and follow its redirects, times and bytes are summed over the hops"""
+        result = self._fetch(url, timeout)
+        hops = 0
+        while result.error is None and result.status_code in REDIRECT_STATUSES:
+            location = result.location
+            if not location:
+                break
+            if hops == self.max_redirects:
+                result.error = f'more than {self.max_redirects} redirects'
+                break
+            hops += 1
+
+            hop = self._fetch(urljoin(result.url, location), timeout)
+            for name in ('dns', 'connect', 'tls', 'ttfb', 'transfer'):
+                value, added = getattr(result, f'{name}_ms'), getattr(hop, f'{name}_ms')
+                if added is not None:
+                    setattr(result, f'{name}_ms', added if value is None else value + added)
+            result.duration_ms += hop.duration_ms
+            result.bytes_read += hop.bytes_read
+            result.status_code, result.error = hop.status_code, hop.error
+            result.reused, result.location = hop.reused, hop.location
+            result.url = hop.url
+
+        result.url = url
+        return result
+
+    def _fetch(self, url: str, timeout: float) -> HttpResult:
+        """Single request without following redirects"""
+        parts = urlsplit(url)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        key = (parts.scheme, parts.hostname, parts.port)
+        timestamp = time.time_ns()
+
+        connection = self._acquire(key)
+        if connection is not None:
+            start_time = time.perf_counter()
+            try:
+                return self._request(connection, key, path, timeout,
+                                     HttpResult(url, reused=True, timestamp=timestamp), start_time)
+            except socket.timeout as e:
+                connection.close()
+                return HttpResult(url, duration_ms=(time.perf_counter() - start_time) * 1000,
+                                  error=str(e), reused=True, timestamp=timestamp)
+            except (http.client.HTTPException, OSError):
+                # The server may have closed the idle connection, retry on a fresh one
+                connection.close()
+
+        if parts.scheme == 'https':
+            connection = TimedHTTPSConnection(parts.hostname, parts.port, timeout, self.context)
+        else:
+            connection = TimedHTTPConnection(parts.hostname, parts.port, timeout)
+
+        start_time = time.perf_counter()
+        try:
+            connection.connect()
+            return self._request(connection, key, path, timeout,
+                                 HttpResult(url, timestamp=timestamp, dns_ms=connection.dns_time * 1000,
+                                            connect_ms=connection.connect_time * 1000,
+                                            tls_ms=connection.tls_time * 1000 if connection.tls_time is not None else None),
+                                 start_time)
+
+        except Exception as e:
+            connection.close()
+            return HttpResult(url, duration_ms=(time.perf_counter() - start_time) * 1000, error=str(e),
+                              timestamp=timestamp)
+
+    def _request(self, connection: TimedHTTPConnection, key: tuple, path: str, timeout: float,
+                 result: HttpResult, start_time: float) -> HttpResult:
+        """Send the request on a connected socket and time the response"""
+        connection.timeout = timeout
+        connection.sock.settimeout(timeout)
+        connection.request('GET', path, headers={
+            'User-Agent': USER_AGENT,
+            'Connection': 'keep-alive' if self.keepalive else 'close',
+        })
+        sent_time = time.perf_counter()
+
+        response = connection.getresponse()
+        first_byte_time = response.first_byte_time
+        result.bytes_read, complete = self._read_body(response)
+        end_time = time.perf_counter()
+
+        result.status_code = response.status
+        result.location = response.getheader('Location')
+        result.ttfb_ms = (first_byte_time - sent_time) * 1000
+        result.transfer_ms = (end_time - first_byte_time) * 1000
+        result.duration_ms = (end_time - start_time) * 1000
+
+        # A partially read body leaves the connection unusable
+        if self.keepalive and complete and not response.will_close:
+            self._release(key, connection)
+        else:
+            connection.close()
+
+        return result
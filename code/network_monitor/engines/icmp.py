@@ -0,0 +1,237 @@
+import math
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..stats import percentile
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# Largest number of requests that can be told apart by the 16-bit sequence field
+MAX_SEQUENCE = 0xFFFF
+
+def checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071) of the given data"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+@dataclass(slots=True)
+class BurstStats:
+    """Statistics of a burst of echo requests to one address, times in milliseconds"""
+    sent: int
+    received: int
+    min: float = math.nan
+    avg: float = math.nan
+    max: float = math.nan
+    stddev: float = math.nan
+    p50: float = math.nan
+    p95: float = math.nan
+    p99: float = math.nan
+    # Mean difference between consecutive round-trip times (RFC 3550 style jitter)
+    jitter: float = math.nan
+
+    @property
+    def loss(self) -> float:
+        """Lost requests in percent"""
+        return 100.0 * (self.sent - self.received) / self.sent if self.sent else 0.0
+
+    @classmethod
+    def from_samples(cls, samples: array) -> 'BurstStats':
+        """
+        Compute the statistics in a few passes over the samples of one burst
+
+        Args:
+            samples: Round-trip times in send order, NaN for lost requests
+        """
+        received = array('d', [rtt for rtt in samples if rtt == rtt])
+        count = len(received)
+        if not count:
+            return cls(len(samples), 0)
+
+        ordered = sorted(received)
+        avg = math.fsum(received) / count
+        variance = math.fsum([(rtt - avg) ** 2 for rtt in received]) / count
+        jitter = math.fsum([abs(b - a) for a, b in zip(received, received[1:])]) / (count - 1) if count > 1 else 0.0
+        return cls(
+            len(samples), count,
+            ordered[0], avg, ordered[-1], math.sqrt(variance),
+            percentile(ordered, 0.50), percentile(ordered, 0.95), percentile(ordered, 0.99),
+            jitter,
+        )
+
+    def fields(self) -> Dict[str, float]:
+        """Statistics by field name, round-trip times only if any reply arrived"""
+        values = {'sent': self.sent, 'received': self.received, 'loss': round(self.loss, 3)}
+        if self.received:
+            for name in ('min', 'avg', 'max', 'stddev', 'p50', 'p95', 'p99', 'jitter'):
+                values[f'rtt_{name}'] = round(getattr(self, name), 4)
+        return values
+
+class Pinger:
+    """
+    Multiplexed ICMP echo engine (IPv4).
+
+    Echo requests to all addresses are sent from a single socket and the
+    replies are matched back by identifier and sequence number, so one
+    cycle takes at most one timeout regardless of the number of targets.
+    An unprivileged datagram ICMP socket is used when the kernel allows it
+    (net.ipv4.ping_group_range), otherwise a raw socket is opened.
+    """
+
+    def __init__(self, payload_size: int = 56):
+        self.payload = bytes(i & 0xFF for i in range(payload_size))
+        self._identifier = (os.getpid() << 4) & 0xFFFF
+        self._lock = threading.Lock()
+
+    def ping(self, addresses: Sequence[str], timeout: float) -> List[Optional[float]]:
+        """
+        Send one echo request to each address and wait for the replies
+
+        Args:
+            addresses: IPv4 addresses to probe
+            timeout: Seconds to wait for all replies
+
+        Returns:
+            list: Round-trip time in milliseconds per address, None on timeout
+        """
+        return [None if rtt != rtt else rtt for rtt in self.burst(addresses, 1, 0.0, timeout)]
+
+    def burst(self, addresses: Sequence[str], count: int, spacing: float, timeout: float) -> array:
+        """
+        Send count echo requests to each address, one round every spacing seconds
+
+        Every round goes to all addresses at once, replies are awaited
+        until timeout seconds after the last round.
+
+        Returns:
+            array: Round-trip times in milliseconds ('d'), count per address in
+            address order, NaN for lost requests
+        """
+        count = max(1, count)
+        results = array('d', [math.nan]) * (len(addresses) * count)
+
+        # The sequence number identifies address and round
+        chunk_size = max(1, MAX_SEQUENCE // count)
+        for start in range(0, len(addresses), chunk_size):
+            self._ping_chunk(addresses[start:start + chunk_size], count, spacing, timeout, results, start * count)
+
+        return results
+
+    def _open_socket(self) -> Tuple[socket.socket, bool]:
+        """Open an ICMP socket, returns the socket and whether it is raw"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            raw = False
+        except PermissionError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            raw = True
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+
+        sock.setblocking(False)
+        return sock, raw
+
+    def _next_identifier(self) -> int:
+        with self._lock:
+            self._identifier = (self._identifier + 1) & 0xFFFF
+            return self._identifier
+
+    def _ping_chunk(self, addresses: Sequence[str], count: int, spacing: float, timeout: float,
+                    results: array, offset: int) -> None:
+        # Sequence -> index of the address, slot in results and send time
+        pending: Dict[int, Tuple[int, int, float]] = {}
+
+        sock, raw = self._open_socket()
+        try:
+            # poll() unlike select() is not limited to descriptors below FD_SETSIZE
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            identifier = self._next_identifier()
+            start_time = time.perf_counter()
+            deadline = start_time + (count - 1) * spacing + timeout
+            round_number = 0
+
+            while True:
+                now = time.perf_counter()
+                if round_number < count and now >= start_time + round_number * spacing:
+                    for index, address in enumerate(addresses):
+                        sequence = round_number * len(addresses) + index + 1
+                        packet = self._build_request(identifier, sequence)
+                        try:
+                            sent_at = time.perf_counter()
+                            sock.sendto(packet, (address, 0))
+                            pending[sequence] = (index, offset + index * count + round_number, sent_at)
+                        except OSError:
+                            # Unroutable address, leave it as lost
+                            pass
+                    round_number += 1
+                    continue
+
+                if round_number == count and not pending:
+                    break
+                wake_time = deadline if round_number == count else start_time + round_number * spacing
+                remaining = wake_time - now
+                if remaining <= 0:
+                    if round_number == count:
+                        break
+                    continue
+                if not poller.poll(remaining * 1000):
+                    continue
+
+                # Drain everything that is queued before waiting again
+                while pending:
+                    try:
+                        data, source = sock.recvfrom(4096)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received_at = time.perf_counter()
+
+                    sequence = self._parse_reply(data, identifier, raw)
+                    entry = pending.get(sequence)
+                    if entry is None or addresses[entry[0]] != source[0]:
+                        continue
+
+                    _, slot, sent_at = pending.pop(sequence)
+                    results[slot] = (received_at - sent_at) * 1000
+
+        finally:
+            sock.close()
+
+    def _build_request(self, identifier: int, sequence: int) -> bytes:
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+        return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0,
+                           checksum(header + self.payload), identifier, sequence) + self.payload
+
+    def _parse_reply(self, data: bytes, identifier: int, raw: bool) -> Optional[int]:
+        """Returns the sequence number of a matching echo reply, None otherwise"""
+        if raw:
+            # Raw sockets deliver the IP header as well
+            data = data[(data[0] & 0x0F) * 4:]
+
+        if len(data) < 8:
+            return None
+
+        icmp_type, code, _, reply_id, sequence = struct.unpack('!BBHHH', data[:8])
+        if icmp_type != ICMP_ECHO_REPLY or code != 0:
+            return None
+
+        # The kernel rewrites the identifier of datagram sockets to the local port
+        # and only delivers replies that belong to the socket
+        if raw and reply_id != identifier:
+            return None
+
+        return sequence
@@ -0,0 +1,167 @@
+import socket
+import socketserver
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Stream header: magic, direction, test duration in milliseconds
+HEADER = struct.Struct('!4sBI')
+# Upload report sent back by the server: bytes received, receive time in seconds
+REPORT = struct.Struct('!Qd')
+MAGIC = b'NMTP'
+
+UPLOAD = 0
+DOWNLOAD = 1
+
+# Longest test the server agrees to run, in seconds
+MAX_DURATION = 300
+
+DEFAULT_PORT = 5301
+
+@dataclass
+class ThroughputResult:
+    """Summary of a throughput test over all streams"""
+    bytes: int
+    seconds: float
+    streams: int
+
+    @property
+    def bits_per_second(self) -> float:
+        return self.bytes * 8 / self.seconds if self.seconds else 0.0
+
+def send_for(sock: socket.socket, buffer: memoryview, duration: float) -> int:
+    """Send the buffer repeatedly for duration seconds, returns bytes sent"""
+    total = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        sock.sendall(buffer)
+        total += len(buffer)
+    sock.shutdown(socket.SHUT_WR)
+    return total
+
+def receive_all(sock: socket.socket, buffer: memoryview) -> Tuple[int, float]:
+    """Receive into the buffer until the peer closes, returns bytes and seconds since the first byte"""
+    total = sock.recv_into(buffer)
+    start_time = time.perf_counter()
+    while True:
+        count = sock.recv_into(buffer)
+        if not count:
+            break
+        total += count
+    return total, time.perf_counter() - start_time
+
+def receive_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed by peer')
+        data += chunk
+    return bytes(data)
+
+class ThroughputClient:
+    """
+    In-process TCP throughput test client.
+
+    Each stream is its own TCP connection. Data is sent from a preallocated
+    memoryview and received with recv_into() into a preallocated buffer per
+    stream. Upload bandwidth is taken from the server-side byte count,
+    download bandwidth from the client side, both counted by the receiver.
+    """
+
+    def __init__(self, buffer_size: int = 128 * 1024, timeout: float = 10.0):
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+
+    def run(self, host: str, port: int = DEFAULT_PORT, duration: float = 10.0,
+            streams: int = 1, direction: int = UPLOAD) -> ThroughputResult:
+        """
+        Run a test with parallel streams
+
+        Raises:
+            OSError: Connection to the server failed
+        """
+        results: List[Optional[Tuple[int, float]]] = [None] * streams
+        errors: List[Exception] = []
+        barrier = threading.Barrier(streams)
+
+        def worker(index: int) -> None:
+            try:
+                with socket.create_connection((host, port), timeout=self.timeout) as sock:
+                    barrier.wait(timeout=self.timeout)
+                    results[index] = self._stream(sock, duration, direction)
+            except Exception as e:
+                barrier.abort()
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return ThroughputResult(
+            bytes=sum(count for count, _ in results),
+            seconds=max(seconds for _, seconds in results),
+            streams=streams,
+        )
+
+    def _stream(self, sock: socket.socket, duration: float, direction: int) -> Tuple[int, float]:
+        sock.sendall(HEADER.pack(MAGIC, direction, int(duration * 1000)))
+        buffer = memoryview(bytearray(self.buffer_size))
+
+        if direction == UPLOAD:
+            send_for(sock, buffer, duration)
+            count, seconds = REPORT.unpack(receive_exact(sock, REPORT.size))
+            return count, seconds
+
+        return receive_all(sock, buffer)
+
+class ThroughputServer(socketserver.ThreadingTCPServer):
+    """
+    Lightweight server side of the throughput test, one thread per stream.
+
+    The wildcard address accepts IPv4 and IPv6 clients on one socket where
+    the host supports dual-stack sockets, IPv4 only otherwise.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ('', DEFAULT_PORT), buffer_size: int = 128 * 1024):
+        self.buffer_size = buffer_size
+        self.dualstack = not address[0] and socket.has_dualstack_ipv6()
+        if self.dualstack or ':' in address[0]:
+            self.address_family = socket.AF_INET6
+        super().__init__(address, ThroughputHandler)
+
+    def server_bind(self):
+        # Same as socket.create_server(dualstack_ipv6=True), which socketserver cannot use
+        if self.dualstack:
+            self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        super().server_bind()
+
+class ThroughputHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        sock = self.request
+        sock.settimeout(MAX_DURATION)
+        try:
+            magic, direction, duration_ms = HEADER.unpack(receive_exact(sock, HEADER.size))
+            if magic != MAGIC:
+                return
+
+            buffer = memoryview(bytearray(self.server.buffer_size))
+            if direction == UPLOAD:
+                count, seconds = receive_all(sock, buffer)
+                sock.sendall(REPORT.pack(count, seconds))
+            elif direction == DOWNLOAD:
+                send_for(sock, buffer, min(duration_ms / 1000, MAX_DURATION))
+
+        except OSError as e:
+            print(f"Throughput stream from {self.client_address[0]} failed: {e}")
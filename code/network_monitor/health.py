@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from .config import HealthConfig
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+class TargetState:
+    """Health of one target, slotted to stay small for large inventories"""
+
+    __slots__ = ('state', 'up', 'failures', 'opened', 'boost', 'retry_time', 'report_time')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.up: Optional[bool] = None
+        # Consecutive failed probes
+        self.failures = 0
+        # Failed trials since the circuit opened, the backoff exponent
+        self.opened = 0
+        # Remaining probes at the fast cadence after a change
+        self.boost = 0
+        self.retry_time = 0.0
+        self.report_time: Optional[float] = None
+
+class TargetHealth:
+    """
+    Per-target circuit breaker and adaptive cadence of one checker.
+
+    A target whose probes fail failure_threshold times in a row opens its
+    circuit. An open target is only probed again after a backoff of the
+    checker interval times backoff, growing with every failed trial up to
+    max_interval. That probe is the half-open trial: it runs with the short
+    trial_timeout, one success closes the circuit again. After a target
+    went up or down the next boost_probes probes run every min_interval,
+    so changes are confirmed quickly.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, TargetState] = {}
+        self._lock = threading.Lock()
+
+    def get(self, target: str) -> Optional[TargetState]:
+        return self._states.get(target)
+
+    def is_open(self, target: str) -> bool:
+        state = self._states.get(target)
+        return state is not None and state.state == OPEN
+
+    def interval(self, target: str, interval: int, config: HealthConfig) -> int:
+        """Next probe interval of the target given its regular interval"""
+        state = self._states.get(target)
+        if state is None:
+            return interval
+        if state.state == OPEN:
+            return max(interval, min(config.max_interval, interval * config.backoff ** state.opened))
+        if state.boost:
+            return min(interval, config.min_interval)
+        return interval
+
+    def due(self, target: str, interval: int, now: float = None) -> bool:
+        """
+        Whether a checker running all targets every interval should probe the target
+
+        Open targets are skipped until their backoff elapsed, rounded to the
+        nearest run of the checker.
+        """
+        state = self._states.get(target)
+        if state is None or state.state != OPEN:
+            return True
+        return (now if now is not None else time.monotonic()) + interval / 2 >= state.retry_time
+
+    def record(self, target: str, up: bool, interval: int, config: HealthConfig, now: float = None) -> Optional[TargetState]:
+        """
+        Update the target with a probe result
+
+        Returns:
+            TargetState: The state if it should be reported, first and after a change, else once per max_interval
+        """
+        now = now if now is not None else time.monotonic()
+
+        with self._lock:
+            state = self._states.get(target)
+            if state is None:
+                state = self._states[target] = TargetState()
+            changed = state.up is not None and state.up != up
+            previous = state.state
+            state.up = up
+
+            if up:
+                state.failures = 0
+                state.opened = 0
+                state.state = CLOSED
+            else:
+                state.failures += 1
+                if state.state == OPEN:
+                    # Bounded, the backoff is capped by max_interval anyway
+                    state.opened = min(state.opened + 1, 32)
+                elif state.failures >= config.failure_threshold:
+                    state.state = OPEN
+                    state.opened = 1
+
+            if changed:
+                state.boost = config.boost_probes
+            elif state.boost:
+                state.boost -= 1
+            if state.state == OPEN:
+                # Backing off, no fast probes
+                state.boost = 0
+                state.retry_time = now + self.interval(target, interval, config)
+
+            if changed or state.state != previous or state.report_time is None or now - state.report_time >= config.max_interval:
+                state.report_time = now
+                return state
+            return None
+
+    def retain(self, targets: Iterable[str]) -> None:
+        """Forget targets that are no longer configured"""
+        with self._lock:
+            keep = set(targets)
+            self._states = {target: state for target, state in self._states.items() if target in keep}
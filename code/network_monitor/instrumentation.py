@@ -0,0 +1,294 @@
+import json
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from .aggregation import get_aggregator
+from .client import get_client
+
+class _RunStats:
+    """Per-checker run counters since the last report"""
+
+    __slots__ = ('runs', 'failures', 'targets', 'duration', 'duration_max',
+                 'lag', 'lag_max', 'send_calls', 'send_time')
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.targets = 0
+        self.duration = 0.0
+        self.duration_max = 0.0
+        self.lag = 0.0
+        self.lag_max = 0.0
+        self.send_calls = 0
+        self.send_time = 0.0
+
+    def values(self) -> Dict[str, float]:
+        runs = self.runs or 1
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'targets': self.targets,
+            'duration': round(self.duration / runs * 1000, 3),
+            'duration_max': round(self.duration_max * 1000, 3),
+            'lag': round(self.lag / runs * 1000, 3),
+            'lag_max': round(self.lag_max * 1000, 3),
+            'send_calls': self.send_calls,
+            'send_time': round(self.send_time * 1000, 3),
+        }
+
+class Instrumentation:
+    """
+    Internal metrics of the monitor itself.
+
+    Every whole-checker run is reported as one 'run' line with its wall time,
+    scheduling lag, targets and the time spent in client.write(). All runs
+    are also summed per checker and reported every interval seconds, which
+    is the only report for the far more frequent per-target runs. A 'process'
+    line with CPU, RSS and the Telegraf client counters is sent at the same
+    interval. All lines go to a separate measurement, the latest values are
+    also served as JSON on a local HTTP endpoint.
+    """
+
+    def __init__(self, measurement: str, interval: float = 60, enabled: bool = True,
+                 http_address: Optional[tuple] = None):
+        self.measurement = measurement
+        self.interval = interval
+        self.enabled = enabled
+        self.http_address = http_address
+
+        self._runs: Dict[str, _RunStats] = {}
+        self._last_runs: Dict[str, dict] = {}
+        self._process: Dict[str, float] = {}
+        # Last run of every external command
+        self._commands: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop_event = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+        self._cpu_time = self._cpu_seconds()
+        self._sample_time = time.monotonic()
+        self._send_batches = 0
+        self._send_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the report thread and the HTTP endpoint, does nothing when already started"""
+        if not self.enabled or self._started:
+            return
+        self._started = True
+
+        threading.Thread(target=self._report_loop, daemon=True).start()
+        if self.http_address is not None:
+            self._serve()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def record_run(self, checker: str, targets: int, duration: float, lag: float, failed: bool,
+                   send_calls: int, send_time: float, per_target: bool = False) -> None:
+        """Account a finished checker run, times in seconds"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stats = self._runs.get(checker)
+            if stats is None:
+                stats = self._runs[checker] = _RunStats()
+            stats.runs += 1
+            stats.failures += failed
+            stats.targets += targets
+            stats.duration += duration
+            stats.duration_max = max(stats.duration_max, duration)
+            stats.lag += lag
+            stats.lag_max = max(stats.lag_max, lag)
+            stats.send_calls += send_calls
+            stats.send_time += send_time
+
+            run = {
+                'targets': targets,
+                'duration': round(duration * 1000, 3),
+                'lag': round(lag * 1000, 3),
+                'send_calls': send_calls,
+                'send_time': round(send_time * 1000, 3),
+                'result': 'failed' if failed else 'success',
+                'time': time.time(),
+            }
+            self._last_runs[checker] = run
+
+        if per_target:
+            return
+
+        get_client().metric(
+            self.measurement,
+            tags={
+                'type': 'run',
+                'checker': checker,
+                'result': run['result'],
+            },
+            values={name: value for name, value in run.items() if name not in ('result', 'time')},
+        )
+
+    def record_process(self, result) -> None:
+        """Report spawn latency, duration and resource usage of a finished external command"""
+        if not self.enabled:
+            return
+
+        values = {
+            **result.usage(),
+            'returncode': result.returncode if result.returncode is not None else -1,
+            'timed_out': result.timed_out,
+        }
+        with self._lock:
+            self._commands[result.command] = {**values, 'time': time.time()}
+
+        get_client().metric(
+            self.measurement,
+            tags={
+                'type': 'subprocess',
+                'command': result.command,
+                'result': 'success' if result.ok else 'failed',
+            },
+            values=values,
+        )
+
+    def get_stats(self) -> dict:
+        """Latest process sample, client and aggregation counters, last run of every checker and command"""
+        with self._lock:
+            return {
+                'process': dict(self._process),
+                'client': get_client().get_stats(),
+                'aggregation': get_aggregator().get_stats(),
+                'subprocesses': dict(self._commands),
+                'checkers': {
+                    name: {'last_run': run, 'since_report': self._runs.get(name, _RunStats()).values()}
+                    for name, run in self._last_runs.items()
+                },
+            }
+
+    def sample_process(self) -> Dict[str, float]:
+        """CPU usage since the previous sample, memory and thread count"""
+        current_time = time.monotonic()
+        cpu_time = self._cpu_seconds()
+        elapsed = current_time - self._sample_time
+
+        process = {
+            'cpu': round(cpu_time - self._cpu_time, 3),
+            'cpu_percent': round((cpu_time - self._cpu_time) / elapsed * 100, 2) if elapsed > 0 else 0.0,
+            'rss': self._rss(),
+            'threads': threading.active_count(),
+        }
+        self._cpu_time, self._sample_time = cpu_time, current_time
+        return process
+
+    def _report_loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._report()
+            except Exception as e:
+                print(f"Internal metrics failed: {e}")
+
+    def _report(self) -> None:
+        client = get_client()
+        process = self.sample_process()
+
+        # Mean latency of the batch writes to Telegraf since the previous report
+        batches = client.send_batches - self._send_batches
+        seconds = client.send_seconds - self._send_seconds
+        self._send_batches, self._send_seconds = client.send_batches, client.send_seconds
+
+        values = {
+            **process,
+            'sent': client.sent_lines,
+            'dropped': client.dropped_lines,
+            'buffered': client.buffered_lines,
+            'errors': client.send_errors,
+            'send_batches': batches,
+            'send_latency': round(seconds / batches * 1000, 3) if batches else 0.0,
+        }
+
+        with self._lock:
+            self._process = values
+            runs, self._runs = self._runs, {}
+
+        client.metric(self.measurement, tags={'type': 'process'}, values=values)
+        for checker, stats in runs.items():
+            client.metric(
+                self.measurement,
+                tags={
+                    'type': 'runs',
+                    'checker': checker,
+                },
+                values=stats.values(),
+            )
+
+    def _serve(self) -> None:
+        """Serve get_stats() as JSON on the local HTTP endpoint"""
+        instrumentation = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = json.dumps(instrumentation.get_stats(), default=str).encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(self.http_address, Handler)
+        except OSError as e:
+            print(f"Internal metrics endpoint disabled, cannot bind {self.http_address[0]}:{self.http_address[1]}: {e}")
+            return
+
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Internal metrics served on http://{self.http_address[0]}:{self._server.server_address[1]}/")
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    @staticmethod
+    def _rss() -> int:
+        """Resident set size in bytes, peak RSS where /proc is not available"""
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+_instrumentation: Optional[Instrumentation] = None
+_instrumentation_lock = threading.Lock()
+
+def get_instrumentation() -> Instrumentation:
+    """Get the process-wide instrumentation, created on first use"""
+    global _instrumentation
+
+    with _instrumentation_lock:
+        if _instrumentation is None:
+            bucket = os.environ.get('INFLUXDB_METRIC', 'network-monitor')
+            enabled = os.environ.get('INTERNAL_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+            http_address = None
+            if os.environ.get('INTERNAL_HTTP_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on'):
+                http_address = (os.environ.get('INTERNAL_HTTP_HOST', '127.0.0.1'),
+                                int(os.environ.get('INTERNAL_HTTP_PORT', '9180')))
+            _instrumentation = Instrumentation(
+                measurement=os.environ.get('INTERNAL_METRIC', f'{bucket}_internal'),
+                interval=float(os.environ.get('INTERNAL_INTERVAL', '60')),
+                enabled=enabled,
+                http_address=http_address,
+            )
+        return _instrumentation
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from .config import SECTIONS, parse_seconds, parse_statuses
+
+# Inventory sections, the checkers that run against a list of targets
+TARGET_SECTIONS = tuple(name for name, (section, _) in SECTIONS.items() if 'targets' in section.__dataclass_fields__)
+
+ENTRY_KEYS = frozenset({'target', 'interval', 'timeout', 'expected_status', 'tags'})
+
+@dataclass(frozen=True, slots=True)
+class InventoryTarget:
+    """Settings of one inventory target, unset options fall back to the checker config"""
+    target: str
+    interval: Optional[int] = None
+    timeout: Optional[int] = None
+    expected_status: Optional[FrozenSet[int]] = None
+    tags: Optional[Dict[str, str]] = None
+
+class Inventory:
+    """
+    Targets with per-target options, indexed by checker section.
+
+    The file holds one list per section (ping, http, https, iperf, iperf3,
+    throughput). An entry is either a target string or a table with
+    'target' and optional 'interval', 'timeout', 'expected_status' and
+    'tags'. TOML example:
+
+        [[https]]
+        target = "example.com/health"
+        interval = "30s"
+        expected_status = [200, 204]
+        tags = { site = "dc1", team = "web" }
+
+    Entries are slotted and equal option values are shared, so 50k targets
+    stay within a few megabytes. JSON loads several times faster than TOML
+    for inventories of that size.
+    """
+
+    def __init__(self, sections: Dict[str, Dict[str, InventoryTarget]] = None, path: str = None):
+        self.path = path
+        self._sections = sections or {}
+
+    def __len__(self) -> int:
+        return sum(len(targets) for targets in self._sections.values())
+
+    def targets(self, section: str) -> Dict[str, InventoryTarget]:
+        """Targets of a section in file order, keyed by target"""
+        return self._sections.get(section, {})
+
+    def get(self, section: str, target: str) -> Optional[InventoryTarget]:
+        return self._sections.get(section, {}).get(target)
+
+    @classmethod
+    def from_data(cls, data: dict, path: str = None) -> 'Inventory':
+        """
+        Build the inventory from parsed file content
+
+        Raises:
+            ValueError: Unknown section or option, or an invalid value
+        """
+        if not isinstance(data, dict):
+            raise ValueError("expected a mapping of sections")
+
+        cache = {}
+        sections = {}
+
+        for section, entries in data.items():
+            if section not in TARGET_SECTIONS:
+                raise ValueError(f"unknown section '{section}', expected one of {', '.join(TARGET_SECTIONS)}")
+            if not isinstance(entries, list):
+                raise ValueError(f"section '{section}' must be a list of targets")
+
+            targets = sections[section] = {}
+            for index, entry in enumerate(entries):
+                try:
+                    item = parse_entry(entry, cache)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"{section}[{index}]: {e}") from None
+                targets[item.target] = item
+
+        return cls(sections, path)
+
+def parse_entry(entry, cache: dict) -> InventoryTarget:
+    """Parse a single target string or table, parsed option values are shared through cache"""
+    if isinstance(entry, str):
+        return InventoryTarget(entry.strip())
+    if not isinstance(entry, dict):
+        raise ValueError("expected a target string or table")
+
+    if not ENTRY_KEYS.issuperset(entry):
+        raise ValueError(f"unknown option(s) {', '.join(sorted(entry.keys() - ENTRY_KEYS))}")
+    target = entry.get('target')
+    if not isinstance(target, str) or not target.strip():
+        raise ValueError("missing 'target'")
+
+    return InventoryTarget(
+        target.strip(),
+        cached(cache, 'interval', entry.get('interval'), seconds),
+        cached(cache, 'timeout', entry.get('timeout'), seconds),
+        cached(cache, 'expected_status', entry.get('expected_status'), statuses),
+        cached(cache, 'tags', entry.get('tags'), tags),
+    )
+
+def cached(cache: dict, name: str, value, parse):
+    """Parse value once per distinct value, so equal options share one object"""
+    if value is None:
+        return None
+    key = (name, tuple(value.items()) if isinstance(value, dict) else tuple(value) if isinstance(value, list) else value)
+    try:
+        return cache[key]
+    except KeyError:
+        result = cache[key] = parse(value)
+        return result
+    except TypeError:
+        # Unhashable nested values, let the parser reject them
+        return parse(value)
+
+def seconds(value) -> int:
+    """Durations may be numbers or strings like '30s'"""
+    return int(value) if isinstance(value, (int, float)) else parse_seconds(str(value))
+
+def statuses(value) -> FrozenSet[int]:
+    if isinstance(value, (list, tuple)):
+        return frozenset(int(status) for status in value)
+    return parse_statuses(str(value))
+
+def tags(value) -> Optional[Dict[str, str]]:
+    if not isinstance(value, dict):
+        raise ValueError("'tags' must be a table")
+    return {str(key): str(item) for key, item in value.items()} or None
+
+def read_file(path: str) -> dict:
+    """
+    Parse a TOML, JSON or YAML file by its extension, YAML needs PyYAML
+
+    Raises:
+        ValueError: Unsupported extension or a syntax error
+        OSError: The file cannot be read
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            try:
+                return tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(str(e)) from None
+
+    if extension == '.json':
+        with open(path, 'rb') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(str(e)) from None
+
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML inventory needs PyYAML, install it or use TOML or JSON") from None
+        with open(path, 'rb') as f:
+            try:
+                return yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+            except yaml.YAMLError as e:
+                raise ValueError(str(e)) from None
+
+    raise ValueError(f"unsupported inventory format '{extension}', use .toml, .json or .yaml")
+
+def load_inventory(path: str = None) -> Inventory:
+    """
+    Load the inventory file at path, an empty inventory if path is empty
+
+    Raises:
+        ValueError: Invalid file content, the message names the entry
+        OSError: The file cannot be read
+    """
+    if not path:
+        return Inventory()
+    try:
+        return Inventory.from_data(read_file(path), path)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+_inventory: Optional[Inventory] = None
+_inventory_lock = threading.Lock()
+
+def inventory_path() -> str:
+    """Optional inventory file given by INVENTORY_FILE"""
+    return os.environ.get('INVENTORY_FILE', '')
+
+def get_inventory() -> Inventory:
+    """Get the current inventory, loaded on first use"""
+    global _inventory
+
+    inventory = _inventory
+    if inventory is not None:
+        return inventory
+
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = load_inventory(inventory_path())
+            if _inventory.path:
+                print(f"Loaded {len(_inventory)} targets from {_inventory.path}")
+        return _inventory
+
+def reload_inventory() -> Optional[Inventory]:
+    """
+    Reload the inventory and swap it in atomically
+
+    Returns:
+        Inventory: The new inventory, None if it is invalid and the current one was kept
+    """
+    global _inventory
+
+    try:
+        inventory = load_inventory(inventory_path())
+    except (OSError, ValueError) as e:
+        print(f"Inventory reload failed, keeping the current inventory: {e}")
+        return None
+
+    with _inventory_lock:
+        _inventory = inventory
+    print(f"Inventory reloaded, {len(inventory)} targets")
+    return inventory
+
+def merge_targets(configured: Iterable[str], inventory: Dict[str, InventoryTarget]) -> list:
+    """Configured targets followed by inventory targets, without duplicates"""
+    return list(dict.fromkeys([*configured, *inventory]))
@@ -0,0 +1,108 @@
+import math
+from typing import Callable, Dict, Hashable, Mapping, Optional, Union
+
+Tags = Union[Mapping[str, str], Callable[[], Mapping[str, str]]]
+
+MEASUREMENT_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ ', '\n': '\\n'})
+TAG_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ ', '=': '\\=', '\n': '\\n'})
+STRING_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+def escape_measurement(name: str) -> str:
+    return name.translate(MEASUREMENT_ESCAPES)
+
+def escape_tag(value) -> str:
+    """Escape a tag key or value"""
+    return str(value).translate(TAG_ESCAPES)
+
+def format_value(value) -> Optional[str]:
+    """Format a field value, None for values line protocol cannot represent"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return f'"{value.translate(STRING_ESCAPES)}"'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else None
+    return f'"{str(value).translate(STRING_ESCAPES)}"'
+
+# Escaped field keys, field names are a small fixed set
+FIELD_KEYS: Dict[str, str] = {}
+
+def format_fields(values) -> str:
+    """Format fields in the given order, None and non-finite values are skipped"""
+    if not isinstance(values, dict):
+        values = {'value': values}
+    fields = []
+    for key, value in values.items():
+        # Fast paths for the common numeric fields
+        kind = type(value)
+        if kind is int:
+            value = f'{value}i'
+        elif kind is float and math.isfinite(value):
+            value = repr(value)
+        else:
+            value = format_value(value)
+            if value is None:
+                continue
+        name = FIELD_KEYS.get(key)
+        if name is None:
+            name = FIELD_KEYS[key] = escape_tag(key)
+        fields.append(f'{name}={value}')
+    return ','.join(fields)
+
+def encode_line(prefix: str, values, timestamp: Optional[int] = None) -> Optional[str]:
+    """
+    Complete a precompiled series prefix with fields and a nanosecond timestamp
+
+    Returns:
+        str: The line, None if no field has a value
+    """
+    fields = format_fields(values)
+    if not fields:
+        return None
+    return f'{prefix} {fields} {timestamp}' if timestamp is not None else f'{prefix} {fields}'
+
+def compile_prefix(measurement: str, tags: Mapping[str, str], global_tags: Mapping[str, str] = None) -> str:
+    """Escaped 'measurement,tag=value,...' with tags sorted by key and empty values dropped"""
+    if global_tags:
+        tags = {**global_tags, **tags}
+    parts = [escape_measurement(measurement)]
+    for key, value in sorted(tags.items()):
+        if value is not None and value != '':
+            parts.append(f'{escape_tag(key)}={escape_tag(value)}')
+    return ','.join(parts)
+
+class SeriesCache:
+    """
+    Precompiled series prefixes of one measurement.
+
+    Callers pick a cheap hashable key that determines the tags, e.g.
+    (target, result), and pass the tags either as a mapping or as a
+    callable that is only invoked when the key is not cached yet. Sorting
+    and escaping then happens once per series instead of once per sample.
+    The cache is dropped as a whole when it grows over max_size.
+    """
+
+    def __init__(self, measurement: str, global_tags: Mapping[str, str] = None, max_size: int = 100_000):
+        self.measurement = measurement
+        self.global_tags = global_tags
+        self.max_size = max_size
+        self._prefixes: Dict[Hashable, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    def prefix(self, key: Hashable, tags: Tags) -> str:
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            if len(self._prefixes) >= self.max_size:
+                self._prefixes = {}
+            prefix = compile_prefix(self.measurement, tags() if callable(tags) else tags, self.global_tags)
+            self._prefixes[key] = prefix
+        return prefix
+
+    def clear(self) -> None:
+        self._prefixes = {}
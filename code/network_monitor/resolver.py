@@ -0,0 +1,241 @@
+import heapq
+import ipaddress
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from .client import get_client
+
+Address = Tuple[int, str]
+
+class _Entry:
+    """Cached resolution result"""
+
+    __slots__ = ('addresses', 'error', 'expires', 'refresh_at', 'used')
+
+    def __init__(self, addresses: List[Address], error: Optional[Exception], expires: float):
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+        self.refresh_at = expires
+        self.used = False
+
+class Resolver:
+    """
+    Process-wide DNS cache in front of the system resolver.
+
+    getaddrinfo() does not expose record TTLs, so answers are kept for the
+    configured ttl and failures for negative_ttl. Entries that were used
+    since they were resolved are refreshed in the background shortly before
+    they expire, so probes keep hitting the cache. Unused entries are dropped.
+    Every real lookup is timed and reported as a 'dns' metric. Hit and miss
+    counters are reported as 'dns-cache' every stats_interval seconds.
+    """
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 30, concurrency: int = 8,
+                 refresh_ahead: float = 0.1, stats_interval: float = 60):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.stats_interval = stats_interval
+        self.bucket = os.environ.get('INFLUXDB_METRIC', 'network-monitor')
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+        self._cache: Dict[Tuple[str, int], _Entry] = {}
+        self._pending: Dict[Tuple[str, int], Future] = {}
+        self._refresh: List[Tuple[float, str, int]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='resolver')
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def resolve(self, host: str, family: int = socket.AF_UNSPEC) -> List[Address]:
+        """
+        Resolve host to a list of (family, address) pairs
+
+        Raises:
+            socket.gaierror: Resolution failed, the failure is cached as well
+        """
+        literal = self._literal(host, family)
+        if literal is not None:
+            return literal
+
+        entry = self._cached_or_pending(host, family)
+        if isinstance(entry, Future):
+            entry = entry.result()
+        if entry.error is not None:
+            raise entry.error
+        return entry.addresses
+
+    def resolve_many(self, hosts: Sequence[str], family: int = socket.AF_UNSPEC) -> Dict[str, Union[List[Address], Exception]]:
+        """Resolve many hosts concurrently, failures are returned as exceptions"""
+        results = {}
+        for host in hosts:
+            try:
+                literal = self._literal(host, family)
+                results[host] = literal if literal is not None else self._cached_or_pending(host, family)
+            except Exception as e:
+                results[host] = e
+
+        for host, entry in results.items():
+            if isinstance(entry, Future):
+                try:
+                    entry = entry.result()
+                except Exception as e:
+                    # Only this host failed, the others are still returned
+                    results[host] = e
+                    continue
+            if isinstance(entry, _Entry):
+                results[host] = entry.error if entry.error is not None else entry.addresses
+        return results
+
+    def _cached_or_pending(self, host: str, family: int) -> Union[_Entry, Future]:
+        """Cached entry if it is still valid, otherwise the future of its lookup"""
+        key = (host, family)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self.hits += 1
+                entry.used = True
+                return entry
+
+            self.misses += 1
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._executor.submit(self._lookup, host, family)
+            return future
+
+    def get_stats(self) -> dict:
+        """Get cache counters"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures,
+            'entries': len(self._cache),
+        }
+
+    def _literal(self, host: str, family: int) -> Optional[List[Address]]:
+        """Bypass the cache for IP address literals"""
+        try:
+            address = ipaddress.ip_address(host.strip('[]'))
+        except ValueError:
+            return None
+        address_family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+        if family not in (socket.AF_UNSPEC, address_family):
+            raise socket.gaierror(socket.EAI_FAMILY, f'{host} is not an address of the requested family')
+        return [(address_family, str(address))]
+
+    def _lookup(self, host: str, family: int) -> _Entry:
+        """Resolve through the system resolver and store the result"""
+        key = (host, family)
+        stored = False
+        start_time = time.perf_counter()
+        try:
+            try:
+                infos = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+                addresses = list(dict.fromkeys((info[0], info[4][0]) for info in infos))
+                entry = _Entry(addresses, None, time.monotonic() + self.ttl)
+            except (OSError, UnicodeError, ValueError) as e:
+                # gaierror, but also invalid names such as labels over 63 characters
+                entry = _Entry([], e, time.monotonic() + self.negative_ttl)
+            duration_ms = (time.perf_counter() - start_time) * 1000
+
+            with self._lock:
+                self._cache[key] = entry
+                self._pending.pop(key, None)
+                stored = True
+                if entry.error is None:
+                    entry.refresh_at = entry.expires - self.ttl * self.refresh_ahead
+                else:
+                    self.failures += 1
+                heapq.heappush(self._refresh, (entry.refresh_at, host, family))
+                self._wakeup.notify()
+        finally:
+            # Never leave the key pending, it would not be looked up again
+            if not stored:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+        get_client().metric(
+            self.bucket,
+            tags={
+                'type': 'dns',
+                'target': host,
+                'result': 'success' if entry.error is None else 'failed',
+            },
+            values={
+                'duration': round(duration_ms, 3),
+            }
+        )
+        return entry
+
+    def _refresh_loop(self) -> None:
+        """Background thread refreshing used entries ahead of expiry and reporting counters"""
+        next_stats = time.monotonic() + self.stats_interval
+
+        while True:
+            due = []
+            with self._lock:
+                timeout = next_stats - time.monotonic()
+                if self._refresh:
+                    timeout = min(timeout, self._refresh[0][0] - time.monotonic())
+                if timeout > 0:
+                    self._wakeup.wait(timeout=timeout)
+
+                current_time = time.monotonic()
+                while self._refresh and self._refresh[0][0] <= current_time:
+                    refresh_at, host, family = heapq.heappop(self._refresh)
+                    key = (host, family)
+                    entry = self._cache.get(key)
+                    # Skip stale heap items left behind by newer lookups
+                    if entry is None or entry.refresh_at != refresh_at or key in self._pending:
+                        continue
+                    if entry.used:
+                        entry.used = False
+                        due.append(key)
+                    elif entry.expires <= current_time:
+                        del self._cache[key]
+                    else:
+                        # Not used yet, drop it at expiry unless it gets used
+                        entry.refresh_at = entry.expires
+                        heapq.heappush(self._refresh, (entry.refresh_at, host, family))
+
+                for key in due:
+                    self._pending[key] = self._executor.submit(self._lookup, *key)
+
+            if current_time >= next_stats:
+                next_stats = current_time + self.stats_interval
+                self._send_stats()
+
+    def _send_stats(self) -> None:
+        get_client().metric(
+            self.bucket,
+            tags={
+                'type': 'dns-cache',
+            },
+            values=self.get_stats(),
+        )
+
+
+_resolver: Optional[Resolver] = None
+_resolver_lock = threading.Lock()
+
+def get_resolver() -> Resolver:
+    """Get the process-wide resolver, created on first use"""
+    global _resolver
+
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = Resolver(
+                ttl=float(os.environ.get('DNS_CACHE_TTL', '300')),
+                negative_ttl=float(os.environ.get('DNS_NEGATIVE_TTL', '30')),
+                concurrency=int(os.environ.get('DNS_CONCURRENCY', '8')),
+            )
+        return _resolver
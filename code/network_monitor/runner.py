@@ -0,0 +1,298 @@
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .instrumentation import get_instrumentation
+
+# Seconds between SIGTERM and SIGKILL when a process group is stopped
+KILL_GRACE = 2.0
+
+@dataclass(slots=True)
+class ProcessResult:
+    """Outcome of a finished child process, times in milliseconds"""
+    args: List[str]
+    returncode: Optional[int] = None
+    stdout: bytes = b''
+    stderr: bytes = b''
+    timed_out: bool = False
+    # Time until the child was executing, fork and exec included
+    spawn_ms: float = 0.0
+    duration_ms: float = 0.0
+    cpu_user: float = 0.0
+    cpu_system: float = 0.0
+    # Peak resident set size of the child in bytes
+    max_rss: int = 0
+
+    @property
+    def command(self) -> str:
+        return os.path.basename(self.args[0])
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    def usage(self) -> Dict[str, float]:
+        """Resource usage by field name"""
+        return {
+            'spawn': round(self.spawn_ms, 3),
+            'duration': round(self.duration_ms, 3),
+            'cpu_user': round(self.cpu_user, 3),
+            'cpu_system': round(self.cpu_system, 3),
+            'max_rss': self.max_rss,
+        }
+
+class ProcessRunner:
+    """
+    Runs external tools without a shell, in their own process group.
+
+    stdout and stderr are read as they arrive through a selector, so a
+    chatty child never blocks on a full pipe and stdout lines can be
+    handled while the tool runs. On timeout, or on shutdown() of the
+    monitor, the whole process group gets SIGTERM and then SIGKILL, which
+    also stops helpers the tool forked. Children are reaped with wait4()
+    to get their CPU time and peak RSS.
+
+    Runs block the calling checker thread, never the scheduler loop.
+    """
+
+    def __init__(self):
+        self._processes: Dict[int, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def run(self, args: Sequence[str], timeout: float, on_line: Callable[[bytes], None] = None,
+            max_output: int = 16 * 1024 * 1024) -> ProcessResult:
+        """
+        Run a command to completion or until timeout seconds elapsed
+
+        Args:
+            args: Program and arguments, no shell is involved
+            timeout: Seconds until the process group is killed
+            on_line: Called with every complete stdout line while the process runs
+            max_output: Bytes of stdout and stderr kept each, the rest is discarded
+
+        Raises:
+            OSError: The program cannot be started
+        """
+        args = [str(arg) for arg in args]
+        result = ProcessResult(args)
+
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        # Popen returns once exec succeeded in the child
+        result.spawn_ms = (time.perf_counter() - start_time) * 1000
+        deadline = start_time + timeout
+
+        with self._lock:
+            self._processes[process.pid] = process
+            closed = self._closed
+        if closed:
+            self._kill_group(process)
+
+        try:
+            try:
+                result.stdout, result.stderr = self._communicate(process, deadline, on_line, max_output)
+                result.timed_out = not self._reap(process, result, deadline)
+            except BaseException:
+                # E.g. a failing on_line, never leave the child running or unreaped
+                if process.returncode is None:
+                    self._kill_group(process)
+                    _, status, usage = os.wait4(process.pid, 0)
+                    self._set_result(process, result, status, usage)
+                raise
+        finally:
+            with self._lock:
+                self._processes.pop(process.pid, None)
+            for pipe in (process.stdout, process.stderr):
+                pipe.close()
+
+        result.duration_ms = (time.perf_counter() - start_time) * 1000
+        get_instrumentation().record_process(result)
+        return result
+
+    def shutdown(self) -> None:
+        """Kill the process groups of all running commands, later runs are killed at once"""
+        with self._lock:
+            self._closed = True
+            processes = list(self._processes.values())
+        for process in processes:
+            self._kill_group(process)
+
+    def _communicate(self, process: subprocess.Popen, deadline: float,
+                     on_line: Optional[Callable[[bytes], None]], max_output: int) -> tuple:
+        """
+        Read both pipes until EOF, the exit of the child or the deadline
+
+        Helpers the child forked may keep the pipes open after it exited,
+        they are killed with the rest of its group once it is gone.
+        """
+        output = {process.stdout.fileno(): bytearray(), process.stderr.fileno(): bytearray()}
+        stdout = process.stdout.fileno()
+        pending = b''
+
+        def read(fd: int) -> bool:
+            """Read what is available, false at EOF"""
+            nonlocal pending
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return True
+            if not data:
+                return False
+
+            buffer = output[fd]
+            if len(buffer) < max_output:
+                buffer += data[:max_output - len(buffer)]
+            if fd == stdout and on_line is not None:
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    on_line(line)
+            return True
+
+        # Readable once the child exited, polled where pidfds are not available
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        try:
+            with selectors.DefaultSelector() as selector:
+                for fd in output:
+                    os.set_blocking(fd, False)
+                    selector.register(fd, selectors.EVENT_READ)
+                if pidfd is not None:
+                    selector.register(pidfd, selectors.EVENT_READ)
+
+                while len(selector.get_map()) > (pidfd is not None):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    events = selector.select(remaining if pidfd is not None else min(remaining, 0.1))
+                    for key, _ in events:
+                        if key.fd != pidfd and not read(key.fd):
+                            selector.unregister(key.fd)
+
+                    if (pidfd is None or events) and self._exited(process):
+                        # Whatever the child wrote is in the pipes, anything later comes from helpers
+                        for fd in output:
+                            if fd in selector.get_map():
+                                while read(fd) and self._readable(fd):
+                                    pass
+                        self._kill_helpers(process)
+                        break
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+
+        if pending and on_line is not None:
+            on_line(pending)
+        return bytes(output[stdout]), bytes(output[process.stderr.fileno()])
+
+    @staticmethod
+    def _exited(process: subprocess.Popen) -> bool:
+        """Whether the child exited, without reaping it"""
+        return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+
+    @staticmethod
+    def _readable(fd: int) -> bool:
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            return bool(selector.select(0))
+
+    @staticmethod
+    def _kill_helpers(process: subprocess.Popen) -> None:
+        """SIGKILL what is left of the group of an exited, not yet reaped child"""
+        try:
+            # The unreaped child keeps the group ID from being reused
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self, process: subprocess.Popen, result: ProcessResult, deadline: float) -> bool:
+        """Wait for the child until the deadline, kill its group after it, returns false if it was killed"""
+        delay = 0.001
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self._kill_group(process)
+                pid, status, usage = os.wait4(process.pid, 0)
+                self._set_result(process, result, status, usage)
+                return False
+            # The pipes are closed, the child is exiting
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+        self._set_result(process, result, status, usage)
+        return True
+
+    @staticmethod
+    def _set_result(process: subprocess.Popen, result: ProcessResult, status: int, usage) -> None:
+        # Reaped here, Popen must not wait for the pid again
+        process.returncode = result.returncode = os.waitstatus_to_exitcode(status)
+        result.cpu_user = usage.ru_utime
+        result.cpu_system = usage.ru_stime
+        # Kilobytes on Linux
+        result.max_rss = usage.ru_maxrss * 1024
+
+    @staticmethod
+    def _kill_group(process: subprocess.Popen) -> None:
+        """SIGTERM the process group, SIGKILL what is left after KILL_GRACE seconds"""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        deadline = time.perf_counter() + KILL_GRACE
+        while time.perf_counter() < deadline:
+            try:
+                # Signal 0 only checks whether any process of the group is left
+                os.killpg(process.pid, 0)
+            except ProcessLookupError:
+                return
+            if ProcessRunner._exited(process):
+                # The leader exited, it stays a member until reaped, kill what it left behind
+                break
+            time.sleep(0.05)
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+_runner: Optional[ProcessRunner] = None
+_runner_lock = threading.Lock()
+
+def get_runner() -> ProcessRunner:
+    """Get the process-wide runner, created on first use"""
+    global _runner
+
+    runner = _runner
+    if runner is not None:
+        return runner
+
+    with _runner_lock:
+        if _runner is None:
+            _runner = ProcessRunner()
+        return _runner
+
+def shutdown_runner() -> None:
+    """Kill all running commands"""
+    with _runner_lock:
+        if _runner is not None:
+            _runner.shutdown()
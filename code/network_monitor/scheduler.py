@@ -1,46 +1,132 @@
 import datetime
+import heapq
+import itertools
+import os
 import time
 import threading
-from typing import List, Dict, Optional, Callable
-from dataclasses import dataclass
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List, Dict, Optional
+from dataclasses import dataclass, field
 from .checkers import BaseChecker
+from .checkers.base import RESOURCE_LIGHT
+from .client import get_client
+from .aggregation import get_aggregator
+from .instrumentation import get_instrumentation
+from .sharding import get_shard
 
-@dataclass
+# Retry delay in seconds after a checker raised an exception
+ERROR_RETRY_INTERVAL = 30
+
+@dataclass(slots=True)
 class ScheduledTask:
-    """Data class for scheduled task"""
+    """
+    Data class for scheduled task, next_time is a time.monotonic() deadline
+
+    A task runs either the whole checker or, when target is set, a single
+    target of it. Slots keep per-target tasks small enough for tens of
+    thousands of targets.
+    """
     checker: BaseChecker
-    next_time: datetime.datetime
+    next_time: float
+    target: Optional[str] = None
     interval: int = 0
     enabled: bool = True
+    running: bool = False
+    start_lag: float = 0.0
+    duration: float = 0.0
+    overrun: float = 0.0
+    entry: Optional[list] = field(default=None, repr=False, compare=False)
 
 class Scheduler:
-    """Main scheduler class for managing monitoring tasks"""
+    """
+    Main scheduler class for managing monitoring tasks
+
+    Deadlines are kept in a binary heap on the monotonic clock. Each run is
+    scheduled from the previous deadline rather than from the completion
+    time, so the schedule does not drift. Removed or disabled tasks are
+    invalidated in place and skipped when they reach the top of the heap.
+
+    Checkers of the light resource class run in parallel. Any other class
+    (e.g. exclusive-bandwidth) allows one running checker at a time, the
+    others wait in a FIFO queue in the order they became due.
+    """
 
-    def __init__(self):
+    def __init__(self, max_workers: int = None, per_target: bool = None):
         self.tasks: List[ScheduledTask] = []
+        # Every added checker, including disabled ones, and its per_target argument
+        self.checkers: Dict[BaseChecker, Optional[bool]] = {}
         self.is_running: bool = False
         self.thread: Optional[threading.Thread] = None
         self.stop_event: threading.Event = threading.Event()
+        self.max_workers: int = max_workers or int(os.environ.get('SCHEDULER_WORKERS', '4'))
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock: threading.Lock = threading.Lock()
+        self.condition: threading.Condition = threading.Condition(self.lock)
+        self.queue: List[list] = []
+        self.counter = itertools.count()
+        self.light_running: int = 0
+        self.exclusive_running: Dict[str, List[ScheduledTask]] = {}
+        self.exclusive_waiting: Dict[str, Deque[List[ScheduledTask]]] = {}
+        if per_target is None and 'SCHEDULER_PER_TARGET' in os.environ:
+            per_target = os.environ['SCHEDULER_PER_TARGET'].lower() in ('true', '1', 'yes', 'on')
+        # None schedules a checker per target only when it needs to, see BaseChecker.per_target_reason()
+        self.per_target: Optional[bool] = per_target
+        self.instrumentation = get_instrumentation()
+        # Checkers only list the targets of this shard, see BaseChecker.configured_targets()
+        self.shard = get_shard()
 
-    def add_checker(self, checker: BaseChecker, initial_delay: int = 0) -> None:
+    def add_checker(self, checker: BaseChecker, initial_delay: int = 0, per_target: bool = None) -> None:
         """
         Add a checker to the scheduler
 
         Args:
             checker: Checker instance to add
             initial_delay: Initial delay in seconds before first run
+            per_target: Schedule each target separately, defaults to the scheduler setting
         """
-        if checker.enabled():
-            next_time = datetime.datetime.now() + datetime.timedelta(seconds=initial_delay)
-            task = ScheduledTask(checker=checker, next_time=next_time)
-            self.tasks.append(task)
-            print(f"Added checker: {checker.__class__.__name__}, first run at: {next_time}")
-        else:
+        self.checkers[checker] = per_target
+
+        if not checker.enabled():
             print(f"Checker disabled: {checker.__class__.__name__}")
+            return
+
+        targets = checker.list_targets() if self._per_target(checker, per_target, warn=True) else []
+
+        if not targets:
+            task = ScheduledTask(checker=checker, next_time=time.monotonic() + initial_delay)
+            with self.condition:
+                self.tasks.append(task)
+                self._push(task)
+            print(f"Added checker: {checker.__class__.__name__}, first run at: {self._wall_time(task.next_time)}")
+            return
+
+        for target in targets:
+            self.add_target(checker, target, initial_delay)
+        print(f"Added checker: {checker.__class__.__name__}, {len(targets)} targets"
+              f"{f' of shard {self.shard}' if self.shard.enabled else ''} "
+              f"spread over {checker.get_interval()}s after {initial_delay}s")
+
+    def add_target(self, checker: BaseChecker, target: str, initial_delay: int = 0) -> ScheduledTask:
+        """
+        Schedule a single target of the checker as its own task
+
+        The first run is shifted by a deterministic phase within the interval,
+        so the targets of one checker are spread evenly instead of firing at once.
+        """
+        interval = checker.get_target_interval(target)
+        phase = self._phase(checker, target) * interval
+        task = ScheduledTask(checker=checker, target=target, interval=interval,
+                             next_time=time.monotonic() + initial_delay + phase)
+        with self.condition:
+            self.tasks.append(task)
+            self._push(task)
+        return task
 
     def remove_checker(self, checker_class_name: str) -> bool:
         """
-        Remove a checker by class name
+        Remove a checker by class name, including all its per-target tasks
 
         Args:
             checker_class_name: Name of the checker class to remove
@@ -48,12 +134,80 @@ class Scheduler:
         Returns:
             bool: True if removed, False if not found
         """
-        for task in self.tasks:
-            if task.checker.__class__.__name__ == checker_class_name:
-                self.tasks.remove(task)
-                print(f"Removed checker: {checker_class_name}")
-                return True
-        return False
+        with self.condition:
+            removed = [task for task in self.tasks if task.checker.__class__.__name__ == checker_class_name]
+            if not removed:
+                return False
+
+            self._remove_tasks(removed)
+            for checker in {task.checker for task in removed}:
+                self.checkers.pop(checker, None)
+
+        print(f"Removed checker: {checker_class_name}")
+        return True
+
+    def reload(self) -> None:
+        """
+        Reconcile the tasks with the current settings of every checker
+
+        Checkers that were enabled or disabled are added or removed. For
+        per-target checkers only added and removed targets are touched, the
+        tasks of unchanged targets keep their deadline and statistics.
+        """
+        for checker, per_target in list(self.checkers.items()):
+            name = checker.__class__.__name__
+            with self.condition:
+                tasks = [task for task in self.tasks if task.checker is checker]
+
+            if not checker.enabled():
+                if tasks:
+                    with self.condition:
+                        self._remove_tasks(tasks)
+                    print(f"Reload: removed checker {name}")
+                continue
+
+            targets = checker.list_targets() if self._per_target(checker, per_target) else []
+            whole = bool(tasks) and tasks[0].target is None
+            if whole and not targets:
+                # Whole-checker runs pick up their settings on the next run
+                continue
+
+            if not tasks or whole or not targets:
+                with self.condition:
+                    self._remove_tasks(tasks)
+                self.add_checker(checker, per_target=per_target)
+                continue
+
+            current = {task.target: task for task in tasks}
+            wanted = set(targets)
+            removed = [task for target, task in current.items() if target not in wanted]
+            added = [target for target in targets if target not in current]
+            with self.condition:
+                self._remove_tasks(removed)
+            for target in added:
+                self.add_target(checker, target)
+            if added or removed:
+                print(f"Reload: {name} +{len(added)} -{len(removed)} targets")
+
+    def _per_target(self, checker: BaseChecker, per_target: Optional[bool], warn: bool = False) -> bool:
+        """Whether to schedule the checker per target, by default when its health or inventory needs it"""
+        if per_target is None:
+            per_target = self.per_target
+        reason = checker.per_target_reason()
+        if per_target is None:
+            return bool(reason)
+        if reason and not per_target and warn:
+            print(f"Warning: {checker.__class__.__name__} runs as a whole although {reason}, "
+                  f"per-target intervals and faster probes after a change are ignored")
+        return per_target
+
+    def _remove_tasks(self, tasks: List[ScheduledTask]) -> None:
+        """Drop tasks from the schedule, running ones finish but are not queued again, must hold the lock"""
+        removed = set(map(id, tasks))
+        self.tasks = [task for task in self.tasks if id(task) not in removed]
+        for task in tasks:
+            task.enabled = False
+            self._invalidate(task)
 
     def start(self) -> None:
         """Start the scheduler in a background thread"""
@@ -66,8 +220,11 @@ class Scheduler:
 
         self.is_running = True
         self.stop_event.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='checker')
         self.thread = threading.Thread(target=self._run_loop, daemon=True)
         self.thread.start()
+        self.instrumentation.start()
+        get_aggregator().start()
         print("Scheduler started")
 
     def stop(self) -> None:
@@ -75,83 +232,258 @@ class Scheduler:
         if not self.is_running:
             return
 
-        self.is_running = False
-        self.stop_event.set()
+        with self.condition:
+            self.is_running = False
+            self.stop_event.set()
+            self.condition.notify_all()
         if self.thread:
             self.thread.join(timeout=5.0)
+        if self.executor:
+            # Running checkers are not interrupted, queued ones are dropped
+            self.executor.shutdown(wait=False, cancel_futures=True)
         print("Scheduler stopped")
 
     def _run_loop(self) -> None:
         """Main scheduler loop running in background thread"""
         while self.is_running and not self.stop_event.is_set():
             try:
-                self._run_pending_tasks()
-                self._sleep_until_next_task()
+                with self.condition:
+                    timeout = self._run_pending_tasks()
+                    if self.is_running:
+                        # Woken up early by stop(), add_checker(), enable_checker() or finished tasks
+                        self.condition.wait(timeout=timeout)
             except Exception as e:
                 print(f"Error in scheduler loop: {e}")
                 time.sleep(1)  # Prevent tight error loop
 
-    def _run_pending_tasks(self) -> None:
-        """Execute all tasks that are due to run"""
-        current_time = datetime.datetime.now()
+    def _run_pending_tasks(self) -> Optional[float]:
+        """
+        Submit all tasks that are due to run to the worker pool, must hold the lock
 
-        for task in self.tasks:
-            if task.enabled and task.next_time <= current_time:
-                try:
-                    print(f"Running checker: {task.checker.__class__.__name__}")
-                    interval = task.checker.check()
-                    task.interval = interval
-                    task.next_time = current_time + datetime.timedelta(seconds=interval)
-                    print(f"Next run for {task.checker.__class__.__name__} at: {task.next_time}")
-                except Exception as e:
-                    print(f"Error running checker {task.checker.__class__.__name__}: {e}")
-                    # Retry after short delay on error
-                    task.next_time = current_time + datetime.timedelta(seconds=30)
-
-    def _sleep_until_next_task(self) -> None:
-        """Calculate and sleep until next task execution"""
-        if not self.tasks:
-            time.sleep(1)
+        Per-target tasks of the same checker that are due together are
+        handed to the checker in one call.
+
+        Returns:
+            float: Seconds until the next deadline, None if the queue is empty
+        """
+        current_time = time.monotonic()
+        batches: Dict[int, List[ScheduledTask]] = {}
+        timeout = None
+
+        while self.queue:
+            deadline, _, task = self.queue[0]
+            if task is None:
+                heapq.heappop(self.queue)
+                continue
+            if deadline > current_time:
+                timeout = deadline - current_time
+                break
+
+            heapq.heappop(self.queue)
+            task.entry = None
+            task.running = True
+            if task.target is None:
+                self._dispatch([task])
+            else:
+                batches.setdefault(id(task.checker), []).append(task)
+
+        for tasks in batches.values():
+            self._dispatch(tasks)
+
+        return timeout
+
+    def _dispatch(self, tasks: List[ScheduledTask]) -> None:
+        """Submit tasks to the worker pool or queue them behind a running exclusive checker, must hold the lock"""
+        resource = tasks[0].checker.resource_class
+        if resource != RESOURCE_LIGHT:
+            if resource in self.exclusive_running:
+                print(f"Checker {self._task_name(tasks[0])} waits for {resource} resource")
+                self.exclusive_waiting.setdefault(resource, deque()).append(tasks)
+                return
+            self.exclusive_running[resource] = tasks
+
+        self.executor.submit(self._execute_tasks, tasks)
+
+    def _start_tasks(self, checker: BaseChecker) -> None:
+        """Track light and exclusive checkers running at the same time, must hold the lock"""
+        if checker.resource_class == RESOURCE_LIGHT:
+            self.light_running += 1
+            for tasks in self.exclusive_running.values():
+                tasks[0].checker.light_overlap = True
+        else:
+            checker.light_overlap = self.light_running > 0
+
+    def _finish_tasks(self, checker: BaseChecker) -> None:
+        """Release the resource and start the next waiting checker, must hold the lock"""
+        resource = checker.resource_class
+        if resource == RESOURCE_LIGHT:
+            self.light_running -= 1
+            return
+
+        self.exclusive_running.pop(resource, None)
+        waiting = self.exclusive_waiting.get(resource)
+        if not self.is_running:
+            # The executor is shut down after stop(), waiting checkers are dropped like queued ones
+            for tasks in waiting or ():
+                for task in tasks:
+                    task.running = False
+            self.exclusive_waiting.pop(resource, None)
             return
 
-        current_time = datetime.datetime.now()
-        next_time = min(task.next_time for task in self.tasks if task.enabled)
+        while waiting:
+            tasks = waiting.popleft()
+            for task in tasks:
+                if not task.enabled:
+                    task.running = False
+            tasks = [task for task in tasks if task.enabled]
+            if tasks:
+                self._dispatch(tasks)
+                break
+
+    def _execute_tasks(self, tasks: List[ScheduledTask]) -> None:
+        """Run a checker on a worker thread and schedule the next run of its tasks"""
+        checker = tasks[0].checker
+        name = self._task_name(tasks[0]) if len(tasks) == 1 else f'{checker.__class__.__name__}[{len(tasks)} targets]'
+        start_time = time.monotonic()
+        for task in tasks:
+            task.start_lag = start_time - task.next_time
+
+        with self.condition:
+            self._start_tasks(checker)
+
+        send_calls, send_time = get_client().thread_stats()
+        probed = checker.probed_targets()
+        failed = False
+        try:
+            if tasks[0].target is None:
+                print(f"Running checker: {name} (lag {tasks[0].start_lag:.3f}s)")
+                interval = checker.check()
+            else:
+                interval = checker.check_targets([task.target for task in tasks])
+        except Exception as e:
+            print(f"Error running checker {name}: {e}")
+            # Retry after short delay on error
+            interval = ERROR_RETRY_INTERVAL
+            failed = True
+
+        finish_time = time.monotonic()
+        duration = finish_time - start_time
+        overrun = max(0.0, duration - interval)
+
+        end_calls, end_time = get_client().thread_stats()
+        self.instrumentation.record_run(
+            checker.__class__.__name__,
+            # Targets the run actually probed, skipped open circuits are not counted
+            targets=checker.probed_targets() - probed,
+            duration=duration,
+            lag=max(task.start_lag for task in tasks),
+            failed=failed,
+            send_calls=end_calls - send_calls,
+            send_time=end_time - send_time,
+            per_target=tasks[0].target is not None,
+        )
+
+        with self.condition:
+            self._finish_tasks(checker)
+            for task in tasks:
+                # Targets may have their own interval in the inventory, it adapts to their health
+                if task.target is not None and not failed:
+                    task.interval = checker.get_target_interval(task.target)
+                else:
+                    task.interval = interval
+                task.duration = duration
+                task.overrun = max(0.0, duration - task.interval)
+                task.next_time = self._next_deadline(task.next_time, task.interval, finish_time)
+                task.running = False
+                if task.enabled:
+                    self._push(task)
+
+        if overrun:
+            print(f"Checker {name} overran its interval by {overrun:.3f}s")
+        if tasks[0].target is None:
+            print(f"Next run for {name} at: {self._wall_time(tasks[0].next_time)}")
+
+    def _next_deadline(self, deadline: float, interval: float, current_time: float) -> float:
+        """Next fixed-rate deadline after current_time, missed runs are skipped"""
+        if interval <= 0:
+            return current_time
+
+        deadline += interval
+        if deadline <= current_time:
+            deadline += ((current_time - deadline) // interval + 1) * interval
+        return deadline
+
+    def _phase(self, checker: BaseChecker, target: str) -> float:
+        """Deterministic offset of the target within the interval, as a fraction in [0, 1)"""
+        return zlib.crc32(f'{checker.name}/{target}'.encode('utf8')) / 2**32
+
+    def _task_name(self, task: ScheduledTask) -> str:
+        name = task.checker.__class__.__name__
+        return name if task.target is None else f'{name}[{task.target}]'
+
+    def _push(self, task: ScheduledTask) -> None:
+        """Queue the task at its next_time and wake up the loop, must hold the lock"""
+        self._invalidate(task)
+        task.entry = [task.next_time, next(self.counter), task]
+        heapq.heappush(self.queue, task.entry)
+        self.condition.notify()
+
+    def _invalidate(self, task: ScheduledTask) -> None:
+        """Mark the queued entry of the task as removed, must hold the lock"""
+        if task.entry is not None:
+            task.entry[2] = None
+            task.entry = None
 
-        if next_time > current_time:
-            sleep_time = (next_time - current_time).total_seconds()
-            # Sleep in small intervals to allow for quick shutdown
-            max_sleep = min(sleep_time, 1.0)  # Sleep max 1 second at a time
-            self.stop_event.wait(timeout=max_sleep)
+    def _wall_time(self, deadline: float) -> datetime.datetime:
+        """Convert monotonic deadline to wall-clock time for display"""
+        return datetime.datetime.now() + datetime.timedelta(seconds=deadline - time.monotonic())
 
     def get_status(self) -> Dict:
         """Get current scheduler status"""
-        return {
-            'running': self.is_running,
-            'task_count': len(self.tasks),
-            'next_run': min(task.next_time for task in self.tasks) if self.tasks else None,
-            'tasks': [
-                {
-                    'checker': task.checker.__class__.__name__,
-                    'enabled': task.enabled,
-                    'interval': task.interval,
-                    'next_run': task.next_time
-                }
-                for task in self.tasks
-            ]
-        }
+        with self.condition:
+            return {
+                'running': self.is_running,
+                'task_count': len(self.tasks),
+                'next_run': self._wall_time(min(task.next_time for task in self.tasks)) if self.tasks else None,
+                'tasks': [
+                    {
+                        'checker': task.checker.__class__.__name__,
+                        'target': task.target,
+                        'resource': task.checker.resource_class,
+                        'enabled': task.enabled,
+                        'interval': task.interval,
+                        'next_run': self._wall_time(task.next_time),
+                        'running': task.running,
+                        'start_lag': task.start_lag,
+                        'duration': task.duration,
+                        'overrun': task.overrun,
+                    }
+                    for task in self.tasks
+                ]
+            }
 
     def enable_checker(self, checker_class_name: str) -> bool:
         """Enable a specific checker"""
-        for task in self.tasks:
-            if task.checker.__class__.__name__ == checker_class_name:
-                task.enabled = True
-                return True
-        return False
+        found = False
+        with self.condition:
+            current_time = time.monotonic()
+            for task in self.tasks:
+                if task.checker.__class__.__name__ == checker_class_name:
+                    found = True
+                    if not task.enabled:
+                        task.enabled = True
+                        task.next_time = max(task.next_time, current_time)
+                        if not task.running:
+                            self._push(task)
+        return found
 
     def disable_checker(self, checker_class_name: str) -> bool:
         """Disable a specific checker"""
-        for task in self.tasks:
-            if task.checker.__class__.__name__ == checker_class_name:
-                task.enabled = False
-                return True
-        return False
+        found = False
+        with self.condition:
+            for task in self.tasks:
+                if task.checker.__class__.__name__ == checker_class_name:
+                    found = True
+                    task.enabled = False
+                    self._invalidate(task)
+        return found
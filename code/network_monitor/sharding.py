@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    """
+    Share of the targets probed by this instance, index in 0..count-1.
+
+    Targets are assigned with jump consistent hashing over a stable hash of
+    the target string, so every instance computes the same assignment
+    without coordination. Going from n to n+1 instances moves only 1/(n+1)
+    of the targets, all of them to the new instance. Instances must keep
+    their index when the count changes.
+    """
+    index: int = 0
+    count: int = 1
+
+    def __post_init__(self):
+        if self.count < 1:
+            raise ValueError(f"SHARD_COUNT must be at least 1, got {self.count}")
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"SHARD_INDEX must be between 0 and {self.count - 1}, got {self.index}")
+
+    def __str__(self) -> str:
+        return f'{self.index}/{self.count}'
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    def owns(self, target: str) -> bool:
+        return self.count == 1 or jump_hash(target_key(target), self.count) == self.index
+
+    def select(self, targets: Iterable[str]) -> list:
+        """Targets owned by this shard, in the given order"""
+        if self.count == 1:
+            return list(targets)
+        return [target for target in targets if self.owns(target)]
+
+    def tags(self) -> Dict[str, str]:
+        """Global tags of the metrics client, none without sharding so existing series are kept"""
+        return {'shard': str(self.index)} if self.enabled else {}
+
+def target_key(target: str) -> int:
+    """64-bit hash of the target that is stable across processes, unlike hash()"""
+    return int.from_bytes(hashlib.blake2b(target.encode('utf8'), digest_size=8).digest(), 'little')
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping and Veach), maps key to a bucket in 0..buckets-1"""
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+_shard: Optional[Shard] = None
+_shard_lock = threading.Lock()
+
+def get_shard() -> Shard:
+    """
+    Get the shard of this instance from SHARD_INDEX and SHARD_COUNT, read once
+
+    Raises:
+        ValueError: Invalid shard settings
+    """
+    global _shard
+
+    shard = _shard
+    if shard is not None:
+        return shard
+
+    with _shard_lock:
+        if _shard is None:
+            _shard = Shard(int(os.environ.get('SHARD_INDEX', '0')), int(os.environ.get('SHARD_COUNT', '1')))
+            if _shard.enabled:
+                print(f"Sharding enabled, probing shard {_shard}")
+        return _shard
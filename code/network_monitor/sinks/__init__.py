@@ -0,0 +1,20 @@
+"""
+Destinations the metrics client delivers line-protocol batches to
+"""
+
+__version__ = "1.0.0"
+
+from .base import Sink, SinkError
+from .stream import StreamSink, TcpSink, UnixSink
+from .udp import UdpSink
+from .influxdb import InfluxDBSink
+
+__all__ = [
+    'Sink',
+    'SinkError',
+    'StreamSink',
+    'TcpSink',
+    'UnixSink',
+    'UdpSink',
+    'InfluxDBSink',
+]
@@ -0,0 +1,222 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from ..spool import MetricSpool
+
+class SinkError(Exception):
+    """A batch could not be delivered, retryable unless permanent is set"""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+class Sink(ABC):
+    """
+    Destination of line-protocol batches with its own delivery threads.
+
+    The client hands every flushed batch to submit(), which only queues
+    the payload, so a slow or unreachable destination never blocks probes
+    or the other sinks. Worker threads deliver queued batches through
+    deliver(). Batches that fail go to the spool, when one is given, and
+    are replayed once the destination accepts data again, idle workers only
+    replay while the last delivery succeeded. Without a spool
+    they are dropped. When more than max_pending batches are queued the
+    oldest one is dropped, fresh data is more valuable.
+
+    Subclasses implement deliver(), raising OSError or SinkError on failure.
+    """
+
+    name = 'sink'
+
+    def __init__(self, spool: Optional[MetricSpool] = None, max_pending: int = 64,
+                 workers: int = 1, timeout: float = 5.0):
+        self.spool = spool
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self.sent_lines = 0
+        self.dropped_lines = 0
+        self.send_errors = 0
+        self.send_batches = 0
+        self.send_seconds = 0.0
+
+        self._pending: Deque[Tuple[bytes, int]] = deque()
+        self._active = 0
+        self._stats_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._replay_lock = threading.Lock()
+        # Outcome of the last delivery, a spool left from a previous run is replayed at start
+        self._delivering = True
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f'{self.name}-sink-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def pending_lines(self) -> int:
+        return sum(lines for _, lines in self._pending)
+
+    @abstractmethod
+    def deliver(self, payload: bytes) -> None:
+        """Write one batch of newline-terminated lines to the destination"""
+        pass
+
+    def submit(self, payload: bytes, lines: int) -> None:
+        """Queue a batch for delivery, never blocks on the destination"""
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                _, dropped = self._pending.popleft()
+                with self._stats_lock:
+                    self.dropped_lines += dropped
+            self._pending.append((payload, lines))
+            self._condition.notify()
+
+    def drain(self, timeout: float = None) -> bool:
+        """Wait until all queued batches were handled, returns false on timeout"""
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout * 2)
+        with self._condition:
+            while self._pending or self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """Deliver queued batches, then stop the workers"""
+        self.drain()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=self.timeout * 2)
+        # Batches still queued after the timeout are kept on disk if possible
+        while self._pending:
+            payload, lines = self._pending.popleft()
+            self._failed(payload, lines)
+        if self.spool is not None:
+            self.spool.close()
+
+    def get_stats(self) -> dict:
+        """Get delivery counters"""
+        stats = {
+            'sent': self.sent_lines,
+            'dropped': self.dropped_lines,
+            'pending': self.pending_lines,
+            'errors': self.send_errors,
+            'batches': self.send_batches,
+            'send_seconds': round(self.send_seconds, 6),
+        }
+        if self.spool is not None:
+            stats['spool'] = self.spool.get_stats()
+        return stats
+
+    def _run(self) -> None:
+        """Worker thread delivering queued batches, replays the spool when idle and the destination is up"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    if not self._condition.wait(timeout=1.0):
+                        break
+                if not self._pending:
+                    if self._stopped:
+                        return
+                    item = None
+                else:
+                    item = self._pending.popleft()
+                    self._active += 1
+
+            if item is None:
+                # A destination that is down is retried with the next fresh batch, not every second
+                if self._delivering:
+                    self._replay()
+                continue
+
+            try:
+                if self._send(*item):
+                    # Replay only after fresh data went through, one segment per batch
+                    self._replay()
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._condition.notify_all()
+
+    def _send(self, payload: bytes, lines: int) -> bool:
+        start_time = time.perf_counter()
+        try:
+            self.deliver(payload)
+        except (OSError, SinkError) as e:
+            with self._stats_lock:
+                self.send_errors += 1
+            print(f"Sink {self} failed to deliver {lines} lines: {e}")
+            if isinstance(e, SinkError) and e.permanent:
+                with self._stats_lock:
+                    self.dropped_lines += lines
+            else:
+                self._delivering = False
+                self._failed(payload, lines)
+            return False
+
+        self._delivering = True
+        with self._stats_lock:
+            self.send_seconds += time.perf_counter() - start_time
+            self.send_batches += 1
+            self.sent_lines += lines
+        return True
+
+    def _failed(self, payload: bytes, lines: int) -> None:
+        if self.spool is not None:
+            try:
+                self.spool.append(payload)
+                return
+            except OSError as e:
+                print(f"Failed to spool {lines} lines: {e}")
+        with self._stats_lock:
+            self.dropped_lines += lines
+
+    def _replay(self) -> bool:
+        """Send the oldest spooled segment, returns true if a segment was replayed"""
+        if self.spool is None or self.spool.empty():
+            return False
+
+        # One replay at a time, concurrent workers would send a segment twice
+        if not self._replay_lock.acquire(blocking=False):
+            return False
+        try:
+            segment = self.spool.read_oldest()
+            if segment is None:
+                return False
+
+            sequence, payload = segment
+            lines = payload.count(b'\n')
+            try:
+                self.deliver(payload)
+            except (OSError, SinkError) as e:
+                with self._stats_lock:
+                    self.send_errors += 1
+                if isinstance(e, SinkError) and e.permanent:
+                    # The destination will never accept the segment, do not retry it forever
+                    print(f"Sink {self} rejected spooled segment {sequence}, dropping {lines} lines: {e}")
+                    self.spool.remove(sequence, 0)
+                    with self._stats_lock:
+                        self.dropped_lines += lines
+                else:
+                    self._delivering = False
+                return False
+
+            self.spool.remove(sequence, lines)
+            with self._stats_lock:
+                self.sent_lines += lines
+            print(f"Sink {self} replayed {lines} spooled lines from segment {sequence}")
+            return True
+        finally:
+            self._replay_lock.release()
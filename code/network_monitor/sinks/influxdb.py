@@ -0,0 +1,156 @@
+import gzip
+import http.client
+import random
+import ssl
+import threading
+from typing import List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from .base import Sink, SinkError
+
+# Statuses worth retrying, the request itself was fine
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# The batch itself is rejected, sending it again cannot succeed
+REJECT_STATUSES = frozenset({400, 413, 422})
+
+class InfluxDBSink(Sink):
+    """
+    InfluxDB v2 /api/v2/write endpoint, no Telegraf in between.
+
+    Every batch is one POST with nanosecond precision, gzip-compressed
+    unless disabled. Each worker takes a keep-alive connection from a
+    shared pool, so up to workers requests are in flight. Connection
+    errors, 429 and 5xx responses are retried with exponential backoff and
+    jitter, honoring Retry-After. Batches rejected with 400, 413 or 422
+    are dropped, other failures go to the spool once retries are used up.
+    """
+
+    name = 'influxdb'
+
+    def __init__(self, url: str = 'http://localhost:8086', org: str = '', bucket: str = '', token: str = '',
+                 gzip_level: int = 6, retries: int = 3, backoff: float = 0.5, max_backoff: float = 30.0,
+                 workers: int = 2, **kwargs):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"invalid InfluxDB URL '{url}'")
+
+        self.url = url
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.path = parts.path.rstrip('/') + '/api/v2/write?' + urlencode(
+            {'org': org, 'bucket': bucket, 'precision': 'ns'})
+        self.headers = {'Content-Type': 'text/plain; charset=utf-8', 'Accept': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f'Token {token}'
+        if gzip_level:
+            self.headers['Content-Encoding'] = 'gzip'
+        self.gzip_level = gzip_level
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried_requests = 0
+
+        self._context = ssl.create_default_context() if self.secure else None
+        self._idle: List[http.client.HTTPConnection] = []
+        self._idle_lock = threading.Lock()
+        self._closing = threading.Event()
+        super().__init__(workers=workers, **kwargs)
+
+    def __str__(self) -> str:
+        return self.url
+
+    def deliver(self, payload: bytes) -> None:
+        body = gzip.compress(payload, compresslevel=self.gzip_level, mtime=0) if self.gzip_level else payload
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                status, reason, retry_after = self._post(body)
+                if 200 <= status < 300:
+                    return
+                error = SinkError(f"HTTP {status} {reason}", permanent=status in REJECT_STATUSES)
+                if status not in RETRY_STATUSES:
+                    raise error
+            except (OSError, http.client.HTTPException) as e:
+                error = SinkError(str(e) or type(e).__name__)
+
+            if attempt == self.retries or self._closing.is_set():
+                raise error
+
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if retry_after is not None:
+                delay = min(self.max_backoff, max(delay, retry_after))
+            self.retried_requests += 1
+            # Closing interrupts the wait, the batch then goes to the spool
+            self._closing.wait(delay)
+
+    def close(self) -> None:
+        self._closing.set()
+        super().close()
+        with self._idle_lock:
+            connections, self._idle = self._idle, []
+        for connection in connections:
+            connection.close()
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats['retries'] = self.retried_requests
+        return stats
+
+    def _post(self, body: bytes) -> tuple:
+        """
+        POST one body on a pooled connection
+
+        Returns:
+            tuple: Status, reason and the Retry-After seconds if given
+        """
+        connection, reused = self._acquire()
+        try:
+            response = self._exchange(connection, body)
+        except ConnectionError:
+            if not reused:
+                raise
+            # The server closed the idle connection, resend once on a fresh one
+            connection = self._connect()
+            response = self._exchange(connection, body)
+
+        if response.will_close:
+            connection.close()
+        else:
+            with self._idle_lock:
+                self._idle.append(connection)
+        return response.status, response.reason, parse_retry_after(response.getheader('Retry-After'))
+
+    def _exchange(self, connection: http.client.HTTPConnection, body: bytes) -> http.client.HTTPResponse:
+        try:
+            connection.request('POST', self.path, body=body, headers=self.headers)
+            response = connection.getresponse()
+            # Read the error message to keep the connection usable
+            response.read()
+            return response
+        except BaseException:
+            connection.close()
+            raise
+
+    def _acquire(self) -> tuple:
+        """Idle pooled connection or a new one, and whether it was reused"""
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.secure:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds, HTTP dates are not used by InfluxDB and ignored"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
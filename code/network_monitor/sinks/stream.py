@@ -0,0 +1,108 @@
+import socket
+import threading
+from abc import abstractmethod
+from typing import Optional
+
+from .base import Sink
+
+class StreamSink(Sink):
+    """
+    Sink writing batches to a persistent stream connection with one sendall().
+
+    Stale connections closed by the peer while idle are detected before a
+    batch is written, a failed write reconnects once. One worker keeps the
+    lines in order.
+    """
+
+    def __init__(self, **kwargs):
+        self.socket: Optional[socket.socket] = None
+        self._socket_lock = threading.Lock()
+        kwargs['workers'] = 1
+        super().__init__(**kwargs)
+
+    def deliver(self, payload: bytes) -> None:
+        with self._socket_lock:
+            for attempt in range(2):
+                try:
+                    if self.socket is not None and self._is_stale():
+                        self._disconnect()
+                    if self.socket is None:
+                        self.socket = self._connect()
+                    self.socket.sendall(payload)
+                    return
+
+                except OSError:
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def close(self) -> None:
+        super().close()
+        with self._socket_lock:
+            self._disconnect()
+
+    @abstractmethod
+    def _connect(self) -> socket.socket:
+        """Open a new connection to the destination"""
+        pass
+
+    def _is_stale(self) -> bool:
+        """Check whether the peer has closed the idle connection"""
+        # Non-blocking peek, unlike select() this works for descriptors over FD_SETSIZE
+        self.socket.settimeout(0.0)
+        try:
+            return not self.socket.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self.socket.settimeout(self.timeout)
+
+    def _disconnect(self) -> None:
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+class TcpSink(StreamSink):
+    """Telegraf socket_listener over TCP"""
+
+    name = 'tcp'
+
+    def __init__(self, host: str = 'localhost', port: int = 8094, **kwargs):
+        self.host = host
+        self.port = port
+        super().__init__(**kwargs)
+
+    def __str__(self) -> str:
+        return f'tcp://{self.host}:{self.port}'
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return sock
+
+class UnixSink(StreamSink):
+    """Telegraf socket_listener on a Unix domain stream socket, no TCP/IP stack involved"""
+
+    name = 'unix'
+
+    def __init__(self, path: str = '/var/run/telegraf.sock', **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+
+    def __str__(self) -> str:
+        return f'unix://{self.path}'
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
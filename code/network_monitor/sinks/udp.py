@@ -0,0 +1,86 @@
+import socket
+import threading
+from typing import Optional
+
+from .base import Sink
+
+# IPv4 and UDP headers, IPv6 headers are 20 bytes longer
+UDP_OVERHEAD = 28
+UDP6_OVERHEAD = 48
+
+class UdpSink(Sink):
+    """
+    Telegraf socket_listener or InfluxDB UDP listener over UDP.
+
+    Lines are packed into as few datagrams as fit the path MTU, a line is
+    never split across datagrams. A line longer than one datagram is sent
+    alone and left to IP fragmentation. Delivery is not acknowledged, only
+    local errors like an unreachable port reported by ICMP are counted.
+    """
+
+    name = 'udp'
+
+    def __init__(self, host: str = 'localhost', port: int = 8094, mtu: int = 1500, **kwargs):
+        self.host = host
+        self.port = port
+        self.mtu = mtu
+        self.datagram_size = mtu - UDP_OVERHEAD
+        self.socket: Optional[socket.socket] = None
+        self.datagrams = 0
+        self._socket_lock = threading.Lock()
+        kwargs['workers'] = 1
+        super().__init__(**kwargs)
+
+    def __str__(self) -> str:
+        return f'udp://{self.host}:{self.port}'
+
+    def pack(self, payload: bytes) -> list:
+        """Split a batch of newline-terminated lines into datagrams of at most datagram_size bytes"""
+        limit = self.datagram_size
+        if len(payload) <= limit:
+            return [payload]
+
+        datagrams = []
+        start = end = 0
+        while end < len(payload):
+            # End of the next line, including its newline
+            stop = payload.find(b'\n', end) + 1 or len(payload)
+            if stop - start > limit and end > start:
+                datagrams.append(payload[start:end])
+                start = end
+            end = stop
+        if end > start:
+            datagrams.append(payload[start:end])
+        return datagrams
+
+    def deliver(self, payload: bytes) -> None:
+        with self._socket_lock:
+            if self.socket is None:
+                self.socket = self._connect()
+            try:
+                for datagram in self.pack(payload):
+                    self.socket.send(datagram)
+                    self.datagrams += 1
+            except OSError:
+                self.socket.close()
+                self.socket = None
+                raise
+
+    def close(self) -> None:
+        super().close()
+        with self._socket_lock:
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+    def _connect(self) -> socket.socket:
+        # Resolve once per socket, connected sockets skip the lookup on every send
+        family, kind, proto, _, address = socket.getaddrinfo(self.host, self.port, type=socket.SOCK_DGRAM)[0]
+        self.datagram_size = self.mtu - (UDP6_OVERHEAD if family == socket.AF_INET6 else UDP_OVERHEAD)
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
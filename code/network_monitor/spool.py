@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+from typing import List, Optional, Tuple
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{12})\.lp$')
+
+class MetricSpool:
+    """
+    Append-only, segment-rotated disk spool for line-protocol records.
+
+    Every append() is written as one block to the current segment file,
+    which is rotated once it exceeds segment_size bytes. When the total
+    size goes over max_size the oldest segments are deleted first. Sealed
+    segments are read back whole, oldest first, for replay.
+    """
+
+    def __init__(self, path: str, segment_size: int = 4 * 1024 * 1024, max_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_size = max(max_size, segment_size)
+
+        self.spooled_lines = 0
+        self.replayed_lines = 0
+        self.evicted_lines = 0
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_size = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._segments: List[Tuple[int, int]] = self._scan()
+        self._sequence = self._segments[-1][0] + 1 if self._segments else 0
+
+    @property
+    def size(self) -> int:
+        """Total size of the spool in bytes"""
+        return sum(size for _, size in self._segments) + self._file_size
+
+    def empty(self) -> bool:
+        return not self._segments and not self._file_size
+
+    def append(self, payload: bytes) -> None:
+        """Append a batch of newline-terminated lines"""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._segment_path(self._sequence), 'ab')
+                self._file_size = 0
+
+            self._file.write(payload)
+            self._file.flush()
+            self._file_size += len(payload)
+            self.spooled_lines += payload.count(b'\n')
+
+            if self._file_size >= self.segment_size:
+                self._seal()
+            self._evict()
+
+    def read_oldest(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Read the oldest segment for replay, the current segment is sealed first if it is the only one
+
+        Returns:
+            tuple: Segment sequence number and its content, None if the spool is empty
+        """
+        with self._lock:
+            if not self._segments and self._file_size:
+                self._seal()
+            if not self._segments:
+                return None
+
+            sequence = self._segments[0][0]
+            with open(self._segment_path(sequence), 'rb') as f:
+                return sequence, f.read()
+
+    def remove(self, sequence: int, replayed: int = 0) -> None:
+        """Delete a segment after it has been replayed"""
+        with self._lock:
+            self._segments = [(seq, size) for seq, size in self._segments if seq != sequence]
+            self.replayed_lines += replayed
+            self._unlink(sequence)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._seal()
+
+    def get_stats(self) -> dict:
+        """Get spool counters"""
+        return {
+            'spooled': self.spooled_lines,
+            'replayed': self.replayed_lines,
+            'evicted': self.evicted_lines,
+            'size': self.size,
+            'segments': len(self._segments) + (1 if self._file_size else 0),
+        }
+
+    def _seal(self) -> None:
+        """Close the current segment and make it available for replay"""
+        self._file.close()
+        self._file = None
+        if self._file_size:
+            self._segments.append((self._sequence, self._file_size))
+            self._sequence += 1
+        self._file_size = 0
+
+    def _evict(self) -> None:
+        """Delete oldest segments while the spool is over its size cap"""
+        while self._segments and self.size > self.max_size:
+            sequence, _ = self._segments.pop(0)
+            with open(self._segment_path(sequence), 'rb') as f:
+                self.evicted_lines += f.read().count(b'\n')
+            self._unlink(sequence)
+            print(f"Spool over {self.max_size} bytes, evicted segment {sequence}")
+
+    def _scan(self) -> List[Tuple[int, int]]:
+        """Find segments left over from a previous run"""
+        segments = []
+        for name in os.listdir(self.path):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                size = os.path.getsize(os.path.join(self.path, name))
+                if size:
+                    segments.append((int(match.group(1)), size))
+                else:
+                    os.remove(os.path.join(self.path, name))
+        return sorted(segments)
+
+    def _segment_path(self, sequence: int) -> str:
+        return os.path.join(self.path, f'segment-{sequence:012d}.lp')
+
+    def _unlink(self, sequence: int) -> None:
+        try:
+            os.remove(self._segment_path(sequence))
+        except FileNotFoundError:
+            pass
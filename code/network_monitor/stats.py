@@ -0,0 +1,8 @@
+from typing import Sequence
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    """Linearly interpolated percentile of an ordered, non-empty sequence"""
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -3,7 +3,7 @@ set -e
 umask 002
 
 if [ "${1:0:1}" = '-' ]; then
-    set -- python -u -m network-monitor "$@"
+    set -- python -u -m network_monitor "$@"
 fi
 
 echo "RUN: $@"